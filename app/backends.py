@@ -0,0 +1,125 @@
+# Pluggable CPU inference backends: fp32 torch, dynamically quantized int8 torch and ONNX Runtime
+import os
+import threading
+
+import numpy as np
+
+from model_registry import get_model, get_tokenizer, loaded_fingerprint, model_dir
+from instrumentation import observe, timer
+from scoring import LocalScorer, bucket_batches, encode_texts, probabilities_to_levels
+
+_backends = {}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+# Function to register a backend class under a config name
+def register_backend(name):
+    def register(cls):
+        _backends[name] = cls
+        return cls
+    return register
+
+
+# Function to list the names accepted by get_backend
+def backend_names():
+    return list(_backends)
+
+
+# Function to get the backend named in config (INFERENCE_BACKEND by default), built once per process
+def get_backend(name=None, directory=model_dir, batch_size=16):
+    name = name or os.getenv('INFERENCE_BACKEND', 'torch')
+    if name not in _backends:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of {backend_names()}.")
+    key = (name, directory, batch_size)
+    backend = _instances.get(key)
+    if backend is not None:
+        return backend
+    with _instances_lock:
+        # Quantizing or creating an ONNX session is as slow as loading the model, so it happens once
+        if key not in _instances:
+            _instances[key] = _backends[name](directory, batch_size=batch_size)
+        return _instances[key]
+
+
+@register_backend('torch')
+class TorchBackend(LocalScorer):
+    """The fp32 PyTorch model shared through the model registry."""
+
+    def __init__(self, directory=model_dir, batch_size=16):
+        model, tokenizer = get_model(directory)
+        super().__init__(model, tokenizer, batch_size=batch_size, fingerprint=f"{loaded_fingerprint(directory)}:torch")
+
+
+@register_backend('torch-int8')
+class QuantizedTorchBackend(LocalScorer):
+    """A private copy of the model with its Linear layers dynamically quantized to int8."""
+
+    def __init__(self, directory=model_dir, batch_size=16):
+        import torch
+        from transformers import CamembertForSequenceClassification
+        from prediction_cache import model_fingerprint
+
+        tokenizer = get_tokenizer(directory)
+        fingerprint = f"{model_fingerprint(directory)}:torch-int8"
+        model = CamembertForSequenceClassification.from_pretrained(directory).eval()
+        # Quantize in place so the fp32 weights are freed rather than kept alongside
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        super().__init__(model, tokenizer, batch_size=batch_size, fingerprint=fingerprint)
+
+
+# Function to export the model to ONNX with dynamic batch and sequence axes
+def export_onnx(directory, onnx_path):
+    import torch
+    from transformers import CamembertForSequenceClassification
+
+    model = CamembertForSequenceClassification.from_pretrained(directory).eval()
+    model.config.return_dict = False
+    example = (torch.ones((1, 8), dtype=torch.long), torch.ones((1, 8), dtype=torch.long))
+    axes = {0: 'batch', 1: 'sequence'}
+    torch.onnx.export(model, example, onnx_path, input_names=['input_ids', 'attention_mask'],
+                      output_names=['logits'], dynamic_axes={'input_ids': axes, 'attention_mask': axes, 'logits': {0: 'batch'}},
+                      opset_version=17, dynamo=False, external_data=False)
+
+
+@register_backend('onnx')
+class OnnxBackend:
+    """The model exported to ONNX (once, next to the weights) and run with onnxruntime."""
+
+    def __init__(self, directory=model_dir, batch_size=16, max_length=512, threads=None):
+        import onnxruntime
+        from prediction_cache import files_fingerprint, model_fingerprint
+
+        onnx_path = os.path.join(directory, 'model.onnx')
+        if not os.path.exists(onnx_path):
+            export_onnx(directory, onnx_path)
+        # The exported graph is part of the identity: it is not re-exported when the weights change
+        self.fingerprint = f"{model_fingerprint(directory)}:{files_fingerprint([onnx_path])}:onnx"
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.tokenizer = get_tokenizer(directory)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def score_texts(self, texts):
+        texts = list(texts)
+        if not texts:
+            return [], []
+        encoded = encode_texts(texts, self.tokenizer, self.max_length)
+        probabilities = [None] * len(encoded)
+        for bucket in bucket_batches(encoded, self.batch_size):
+            longest = max(len(encoded[i]) for i in bucket)
+            input_ids = np.full((len(bucket), longest), self.tokenizer.pad_token_id, dtype=np.int64)
+            attention_mask = np.zeros((len(bucket), longest), dtype=np.int64)
+            for row, i in enumerate(bucket):
+                input_ids[row, :len(encoded[i])] = encoded[i]
+                attention_mask[row, :len(encoded[i])] = 1
+            observe('batch_size', len(bucket))
+            with timer('forward'):
+                logits = self.session.run(['logits'], {'input_ids': input_ids, 'attention_mask': attention_mask})[0]
+            exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+            for i, row in zip(bucket, (exp / exp.sum(axis=-1, keepdims=True)).tolist()):
+                probabilities[i] = row
+        return probabilities_to_levels(probabilities), probabilities
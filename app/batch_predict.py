@@ -0,0 +1,221 @@
+# Offline bulk scoring of CSV corpora shaped like data/unlabelled_test_data.csv (id,sentence)
+import argparse
+import csv
+import json
+import os
+import queue
+import resource
+import threading
+import time
+
+from model_registry import get_model, loaded_fingerprint, model_dir
+from scoring import cefr_levels, encode_texts, probabilities_to_levels, score_encoded
+
+output_columns = ['id', 'difficulty'] + [f'p_{level}' for level in cefr_levels]
+
+
+# Function to stream (id, sentence) chunks from a CSV file, skipping rows already scored
+def read_chunks(path, chunk_size, skip=0):
+    with open(path, newline='', encoding='utf-8') as f:
+        chunk = []
+        for row_number, row in enumerate(csv.DictReader(f)):
+            if row_number < skip:
+                continue
+            chunk.append((row['id'], row['sentence']))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+# Function to tokenize chunks on a background thread while the model scores the previous one
+def tokenize_ahead(chunks, tokenizer, max_length, depth=2):
+    encoded_chunks = queue.Queue(maxsize=depth)
+    done = object()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                sentences = [sentence for _, sentence in chunk]
+                # Every row is seen once, so the token cache would only hold memory
+                encoded_chunks.put((chunk, encode_texts(sentences, tokenizer, max_length, cache=False)))
+            encoded_chunks.put(done)
+        except BaseException as e:
+            encoded_chunks.put(e)
+
+    threading.Thread(target=produce, name='batch-predict-tokenizer', daemon=True).start()
+    while True:
+        item = encoded_chunks.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+# Function to stream (chunk, encoded) pairs from a corpus written by tokenization.pretokenize
+def read_pretokenized_chunks(prefix, chunk_size, skip=0):
+    from tokenization import PretokenizedCorpus
+    corpus = PretokenizedCorpus(prefix)
+    for start in range(skip, len(corpus), chunk_size):
+        indices = range(start, min(start + chunk_size, len(corpus)))
+        yield [(corpus.row_ids[i], None) for i in indices], corpus.encoded(indices)
+
+
+# Function to load the checkpoint left by an interrupted run
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+# Function to describe what a run scores and writes; a checkpoint is only resumed by a run that matches it
+def run_settings(input_path, output_format, pretokenized, fingerprint):
+    # A pretokenized corpus is identified by its token ids, a CSV by the file itself
+    rows_path = input_path + '.ids.npy' if pretokenized else input_path
+    return {'input': os.path.abspath(input_path), 'input_bytes': os.path.getsize(rows_path),
+            'format': output_format, 'pretokenized': pretokenized, 'model_fingerprint': fingerprint}
+
+
+# Function to refuse a checkpoint left by a run over other rows, another format or another model
+def check_checkpoint(checkpoint, settings, checkpoint_path):
+    changed = [name for name in settings if checkpoint.get(name) != settings[name]]
+    if changed:
+        raise ValueError(f"Cannot resume {checkpoint_path}: {', '.join(changed)} changed; "
+                         f"pass --restart to start over.")
+
+
+# Function to write the checkpoint atomically so a crash never leaves half a file
+def write_checkpoint(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+# Writes rows incrementally to one CSV file, truncating back to the checkpoint on resume
+class CsvOutput:
+    def __init__(self, path, checkpoint):
+        self.path = path
+        resuming = checkpoint is not None and os.path.exists(path)
+        self.f = open(path, 'r+' if resuming else 'w', newline='', encoding='utf-8')
+        if resuming:
+            self.f.truncate(checkpoint['output_bytes'])
+            self.f.seek(checkpoint['output_bytes'])
+        self.writer = csv.writer(self.f)
+        if not resuming:
+            self.writer.writerow(output_columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        return {'output_bytes': self.f.tell()}
+
+    def close(self):
+        self.f.close()
+
+
+# Writes each chunk as a part file of a Parquet dataset directory
+class ParquetOutput:
+    def __init__(self, path, checkpoint):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.parts = checkpoint['parts'] if checkpoint else 0
+        os.makedirs(path, exist_ok=True)
+        # Parts written after the last checkpoint are incomplete and are rewritten
+        for name in os.listdir(path):
+            if name.startswith('part-') and int(name[5:11]) >= self.parts:
+                os.remove(os.path.join(path, name))
+        self.schema = pa.schema([('id', pa.string()), ('difficulty', pa.string())] +
+                                [(name, pa.float32()) for name in output_columns[2:]])
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        table = self.pa.table({name: list(values) for name, values in zip(output_columns, columns)}, schema=self.schema)
+        self.pq.write_table(table, os.path.join(self.path, f'part-{self.parts:06d}.parquet'))
+        self.parts += 1
+        return {'parts': self.parts}
+
+    def close(self):
+        pass
+
+
+# Function to report the peak resident set size of this process in megabytes
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if os.uname().sysname == 'Darwin' else peak / 1024
+
+
+def predict_file(input_path, output_path, output_format, directory=model_dir, chunk_size=1024,
+                 batch_size=32, max_length=512, resume=True, pretokenized=False):
+    """Score every sentence of input_path and write id, difficulty and class probabilities.
+
+    With pretokenized, input_path is the prefix of a pre-tokenized corpus and tokenization is skipped.
+    """
+    model, tokenizer = get_model(directory)
+    settings = run_settings(input_path, output_format, pretokenized, loaded_fingerprint(directory))
+    checkpoint_path = output_path.rstrip('/') + '.ckpt'
+    checkpoint = read_checkpoint(checkpoint_path) if resume else None
+    if checkpoint and not os.path.exists(output_path):
+        checkpoint = None
+    if checkpoint:
+        # Checked before the output is opened, since opening it truncates back to the checkpoint
+        check_checkpoint(checkpoint, settings, checkpoint_path)
+    rows_done = checkpoint['rows_done'] if checkpoint else 0
+    output = (ParquetOutput if output_format == 'parquet' else CsvOutput)(output_path, checkpoint)
+
+    start = time.perf_counter()
+    scored = 0
+    try:
+        if pretokenized:
+            chunks = read_pretokenized_chunks(input_path, chunk_size, rows_done)
+        else:
+            chunks = tokenize_ahead(read_chunks(input_path, chunk_size, rows_done), tokenizer, max_length)
+        for chunk, encoded in chunks:
+            probabilities = score_encoded(encoded, model, tokenizer.pad_token_id, batch_size)
+            rows = [[sentence_id, level] + [round(p, 6) for p in row]
+                    for (sentence_id, _), level, row in zip(chunk, probabilities_to_levels(probabilities), probabilities)]
+            state = output.write(rows)
+            rows_done += len(rows)
+            scored += len(rows)
+            write_checkpoint(checkpoint_path, dict(state, rows_done=rows_done, **settings))
+    finally:
+        output.close()
+    seconds = time.perf_counter() - start
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return {'rows_scored': scored, 'rows_total': rows_done, 'seconds': seconds,
+            'sentences_per_second': scored / seconds if seconds else 0.0, 'peak_rss_mb': peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a CSV of sentences (id,sentence) with the CamemBERT model.')
+    parser.add_argument('input', help='CSV file with id and sentence columns, or a prefix with --pretokenized')
+    parser.add_argument('output', help='CSV file, or directory of Parquet parts with --format parquet')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None,
+                        help='Output format (default: from the output extension)')
+    parser.add_argument('--model-dir', default=model_dir)
+    parser.add_argument('--chunk-size', type=int, default=1024, help='Rows read, scored and checkpointed together')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--max-length', type=int, default=512)
+    parser.add_argument('--pretokenized', action='store_true',
+                        help='Input is a corpus written by tokenization.py (ids are not re-tokenized)')
+    parser.add_argument('--restart', action='store_true', help='Ignore any checkpoint and start from the first row')
+    args = parser.parse_args()
+
+    output_format = args.format or ('parquet' if args.output.rstrip('/').endswith('.parquet') else 'csv')
+    report = predict_file(args.input, args.output, output_format, args.model_dir, args.chunk_size,
+                          args.batch_size, args.max_length, resume=not args.restart,
+                          pretokenized=args.pretokenized)
+    print(f"scored {report['rows_scored']} sentences ({report['rows_total']} in output) "
+          f"in {report['seconds']:.1f}s: {report['sentences_per_second']:.1f} sentences/sec, "
+          f"peak RSS {report['peak_rss_mb']:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
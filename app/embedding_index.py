@@ -0,0 +1,259 @@
+# Precomputed CamemBERT embeddings and difficulty probabilities of a reference corpus, memory-mapped for search
+import argparse
+import csv
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from instrumentation import timer
+from model_registry import loaded_fingerprint, model_dir
+from scoring import bucket_batches, cefr_levels, encode_texts, pad_batch
+
+logger = logging.getLogger(__name__)
+
+# Where the index of data/training_data.csv is read from, as a path prefix
+index_prefix = os.getenv('EMBEDDING_INDEX_PREFIX', os.path.join(model_dir, 'reference_index'))
+
+# Self-assessment answers and how far each moves the estimate, in levels times the current step
+assessment_answers = {'I understand it': 1, 'I get the gist': 0, "I don't understand it": -1}
+
+_index_lock = threading.Lock()
+_index = None
+
+
+# Function to compute mean-pooled, L2-normalized embeddings and class probabilities in input order
+def embed_encoded(encoded, model, pad_token_id, batch_size=32):
+    import torch
+
+    hidden_size = model.config.hidden_size
+    embeddings = np.zeros((len(encoded), hidden_size), dtype=np.float32)
+    probabilities = np.zeros((len(encoded), len(cefr_levels)), dtype=np.float32)
+    with torch.inference_mode():
+        for bucket in bucket_batches(encoded, batch_size):
+            input_ids, attention_mask = pad_batch([encoded[i] for i in bucket], pad_token_id)
+            with timer('forward'):
+                outputs = model(input_ids=input_ids, attention_mask=attention_mask, output_hidden_states=True)
+            mask = attention_mask.unsqueeze(-1).to(outputs.hidden_states[-1].dtype)
+            pooled = (outputs.hidden_states[-1] * mask).sum(dim=1) / mask.sum(dim=1)
+            embeddings[bucket] = torch.nn.functional.normalize(pooled, dim=-1).float().numpy()
+            probabilities[bucket] = torch.softmax(outputs.logits, dim=-1).float().numpy()
+    return embeddings, probabilities
+
+
+# Function to get the sizes of the files that identify a model, a check that needs no hashing
+def model_file_sizes(directory=model_dir):
+    from prediction_cache import fingerprint_files
+
+    paths = {name: os.path.join(directory, name) for name in fingerprint_files}
+    return {name: os.path.getsize(path) for name, path in paths.items() if os.path.exists(path)}
+
+
+# Function to embed a labelled CSV chunk by chunk into float16 memory-mapped matrices
+def build_index(csv_path, prefix, model, tokenizer, fingerprint=None, batch_size=32, max_length=512,
+                chunk_size=1024, model_sizes=None):
+    """Write <prefix>.embeddings.npy, <prefix>.probabilities.npy, <prefix>.labels.npy and <prefix>.json.
+
+    Labels are level indices, or -1 for rows without a difficulty. fingerprint and model_sizes
+    (from model_file_sizes()) record which model the index was built with.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    texts = [row['sentence'] for row in rows]
+    embeddings = np.lib.format.open_memmap(prefix + '.embeddings.npy', mode='w+', dtype=np.float16,
+                                           shape=(len(texts), model.config.hidden_size))
+    probabilities = np.lib.format.open_memmap(prefix + '.probabilities.npy', mode='w+', dtype=np.float16,
+                                              shape=(len(texts), len(cefr_levels)))
+    for start in range(0, len(texts), chunk_size):
+        chunk = texts[start:start + chunk_size]
+        encoded = encode_texts(chunk, tokenizer, max_length, cache=False)
+        embeddings[start:start + len(chunk)], probabilities[start:start + len(chunk)] = \
+            embed_encoded(encoded, model, tokenizer.pad_token_id, batch_size)
+    embeddings.flush()
+    probabilities.flush()
+    del embeddings, probabilities
+    labels = [cefr_levels.index(row['difficulty']) if row.get('difficulty') in cefr_levels else -1 for row in rows]
+    np.save(prefix + '.labels.npy', np.asarray(labels, dtype=np.int8))
+    with open(prefix + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'source': os.path.abspath(csv_path), 'model_fingerprint': fingerprint,
+                   'model_sizes': model_sizes, 'pooling': 'mean',
+                   'hidden_size': model.config.hidden_size, 'texts': texts,
+                   'row_ids': [row.get('id', str(i)) for i, row in enumerate(rows)]}, f, ensure_ascii=False)
+    return EmbeddingIndex(prefix)
+
+
+class EmbeddingIndex:
+    """A reference corpus written by build_index(), mapped read-only into memory.
+
+    Embeddings are unit vectors, so cosine similarity is a dot product. The float16 matrix is
+    multiplied in float32 chunks, which keeps a search over the whole corpus in the
+    millisecond range without holding a float32 copy.
+    """
+
+    def __init__(self, prefix, chunk_rows=8192):
+        with open(prefix + '.json', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.embeddings = np.load(prefix + '.embeddings.npy', mmap_mode='r')
+        self.probabilities = np.load(prefix + '.probabilities.npy', mmap_mode='r')
+        self.labels = np.load(prefix + '.labels.npy')
+        self.texts = self.meta['texts']
+        self.chunk_rows = chunk_rows
+        # Expected level index (0 for A1 ... 5 for C2) of every sentence
+        self.expected = self.probabilities.astype(np.float32) @ np.arange(len(cefr_levels), dtype=np.float32)
+        self.calibration = self._fit_calibration()
+        self.calibrated = self.calibrate(self.expected)
+
+    def __len__(self):
+        return len(self.texts)
+
+    # Function to map the model's expected level onto the labelled scale, from per-level medians
+    def _fit_calibration(self):
+        """Fit a monotone map from the per-level medians by isotonic regression (pool adjacent violators).
+
+        A model that ranks two levels the wrong way round gets them pooled into one point at
+        their mean, so a higher expected level never maps below a lower one.
+        """
+        points = sorted((float(np.median(self.expected[self.labels == level])), level)
+                        for level in range(len(cefr_levels)) if (self.labels == level).any())
+        # Each block is [sum of x, sum of levels, number of points]
+        blocks = []
+        for x, y in points:
+            blocks.append([x, float(y), 1])
+            # np.interp needs strictly increasing x, and the levels must increase with it
+            while len(blocks) > 1 and (blocks[-2][1] / blocks[-2][2] >= blocks[-1][1] / blocks[-1][2]
+                                       or blocks[-2][0] / blocks[-2][2] >= blocks[-1][0] / blocks[-1][2]):
+                x_sum, y_sum, n = blocks.pop()
+                blocks[-1] = [blocks[-1][0] + x_sum, blocks[-1][1] + y_sum, blocks[-1][2] + n]
+        if len(blocks) < 2:
+            return None
+        return (np.asarray([x / n for x, _, n in blocks]),
+                np.asarray([y / n for _, y, n in blocks], dtype=np.float32))
+
+    # Function to turn expected levels from the model into calibrated level positions
+    def calibrate(self, expected):
+        expected = np.asarray(expected, dtype=np.float32)
+        if self.calibration is None:
+            return expected
+        return np.interp(expected, *self.calibration).astype(np.float32)
+
+    def _top(self, scores, k, exclude, largest):
+        if exclude is not None and len(exclude):
+            scores = scores.copy()
+            scores[np.asarray(list(exclude))] = -np.inf if largest else np.inf
+        k = min(k, len(scores))
+        order = -scores if largest else scores
+        top = np.argpartition(order, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(order[top], kind='stable')]
+        return top, scores[top]
+
+    # Function to find the k sentences most similar to query, returning (indices, cosine similarities)
+    def search(self, query, k=10, exclude=None):
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), self.chunk_rows):
+            chunk = self.embeddings[start:start + self.chunk_rows]
+            scores[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+        return self._top(scores, k, exclude, largest=True)
+
+    # Function to find the k sentences whose calibrated level is closest to position (0 for A1 ... 5 for C2)
+    def near_level(self, position, k=10, exclude=None):
+        return self._top(np.abs(self.calibrated - position), k, exclude, largest=False)
+
+    # Function to find the sentences nearest to sentence i, excluding itself
+    def neighbours(self, i, k=10):
+        return self.search(self.embeddings[i], k, exclude=[i])
+
+
+class AdaptiveAssessment:
+    """A self-assessment that picks each sentence at the learner's current estimated level.
+
+    The estimate starts at B1 and moves up or down by a step that shrinks after every answer,
+    a binary search over the calibrated level scale. Among the sentences closest to the
+    estimate, the one least similar to those already shown is asked next.
+    """
+
+    def __init__(self, length=8, start=2.5, step=1.5, shrink=0.7, candidates=20):
+        self.length = length
+        self.position = start
+        self.step = step
+        self.shrink = shrink
+        self.candidates = candidates
+        self.asked = []
+        self.answers = []
+        self.current = None
+
+    def done(self):
+        return len(self.answers) >= self.length
+
+    # Function to get the sentence to ask now, choosing it once per question so reruns show the same one
+    def next_item(self, index):
+        if self.current is None:
+            candidates, _ = index.near_level(self.position, self.candidates, exclude=self.asked)
+            if self.asked:
+                shown = index.embeddings[self.asked].astype(np.float32)
+                similarity = (index.embeddings[candidates].astype(np.float32) @ shown.T).max(axis=1)
+                candidates = candidates[np.argsort(similarity, kind='stable')]
+            self.current = int(candidates[0])
+        return self.current
+
+    def record(self, answer):
+        self.asked.append(self.current)
+        self.answers.append(answer)
+        self.position = float(np.clip(self.position + assessment_answers[answer] * self.step, 0, len(cefr_levels) - 1))
+        self.step *= self.shrink
+        self.current = None
+
+    def level(self):
+        return cefr_levels[int(round(self.position))]
+
+
+# Function to get the shared index, or None if it has not been built
+def get_embedding_index(prefix=index_prefix):
+    global _index
+    with _index_lock:
+        if _index is None and os.path.exists(prefix + '.json'):
+            _index = EmbeddingIndex(prefix)
+            if built_with_other_model(_index.meta):
+                logger.warning("Embedding index %s was built with another model; rebuild it with embedding_index.py", prefix)
+        return _index
+
+
+# Function to check an index's model against the current one without hashing the weights on a page view
+def built_with_other_model(meta, directory=model_dir):
+    current = loaded_fingerprint(directory)
+    if current is not None and meta.get('model_fingerprint') is not None:
+        return current != meta['model_fingerprint']
+    # Before the model is loaded, only the file sizes are compared
+    built = meta.get('model_sizes')
+    current = model_file_sizes(directory)
+    return bool(built) and any(name in current and current[name] != size for name, size in built.items())
+
+
+def main():
+    from model_registry import get_model
+    from prediction_cache import model_fingerprint
+
+    parser = argparse.ArgumentParser(description='Embed a labelled CSV into a memory-mapped reference index.')
+    parser.add_argument('input', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                                                 'data', 'training_data.csv'))
+    parser.add_argument('prefix', nargs='?', default=index_prefix)
+    parser.add_argument('--model-dir', default=model_dir)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--max-length', type=int, default=512)
+    args = parser.parse_args()
+
+    model, tokenizer = get_model(args.model_dir)
+    start = time.perf_counter()
+    index = build_index(args.input, args.prefix, model, tokenizer, model_fingerprint(args.model_dir),
+                        args.batch_size, args.max_length, model_sizes=model_file_sizes(args.model_dir))
+    size = sum(os.path.getsize(args.prefix + suffix) for suffix in ['.embeddings.npy', '.probabilities.npy'])
+    print(f"{len(index)} sentences embedded in {time.perf_counter() - start:.1f}s, "
+          f"{size / 2**20:.1f} MiB of float16 matrices written to {args.prefix}.*")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+# Feature-based difficulty classifier used as a cheap first stage in front of CamemBERT
+import argparse
+import csv
+import hashlib
+import io
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from instrumentation import inc, timer
+from scoring import cefr_levels, probabilities_to_levels
+
+logger = logging.getLogger(__name__)
+
+# Labelled sentences the classifier is trained on by main()
+training_data_path = os.getenv('TRAINING_DATA_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'training_data.csv'))
+
+# Where the trained classifier is saved and loaded from
+fallback_model_path = os.getenv('FALLBACK_MODEL_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'fallback_classifier.npz'))
+
+# Names of the dense features, in column order
+dense_features = ['log_chars', 'log_words', 'word_length_mean', 'word_length_std', 'word_length_max',
+                  'long_word_fraction', 'commas_per_word', 'punctuation_per_word', 'log_frequency_mean',
+                  'log_frequency_min', 'rare_word_fraction']
+
+_word = re.compile(r"\w+(?:[-']\w+)*")
+_punctuation = re.compile(r"[;:()«»\"—–]")
+_classifier_lock = threading.Lock()
+_classifier = None
+_classifier_signature = None
+_warned_missing = set()
+
+
+# Function to hash a term to a bucket, stable across processes unlike hash()
+def bucket(term, buckets):
+    return zlib.crc32(term.encode('utf-8')) % buckets
+
+
+def words_of(text):
+    return _word.findall(text.lower())
+
+
+class FeatureClassifier:
+    """Multinomial logistic regression over dense text statistics and hashed word n-grams.
+
+    Word frequencies come from the training corpus and are kept as hashed counts, so the
+    whole model is a handful of small arrays and one prediction is a few dozen lookups.
+    """
+
+    def __init__(self, dense_weights, hashed_weights, bias, feature_mean, feature_std, frequencies):
+        self.dense_weights = dense_weights
+        self.hashed_weights = hashed_weights
+        self.bias = bias
+        self.feature_mean = feature_mean
+        self.feature_std = feature_std
+        self.frequencies = frequencies
+        self.log_total = math.log(max(frequencies.sum(), 1))
+        # SHA-256 of the file the classifier was loaded from; None for one trained in memory
+        self.digest = None
+
+    # Function to compute the dense features and the hashed n-gram buckets of one text
+    @staticmethod
+    def featurize(text, frequencies, log_total, buckets):
+        words = words_of(text)
+        n = max(len(words), 1)
+        lengths = np.fromiter((len(word) for word in words), dtype=np.float32, count=len(words)) if words \
+            else np.zeros(1, dtype=np.float32)
+        counts = frequencies[[bucket(word, len(frequencies)) for word in words]] if words else np.zeros(1)
+        log_frequency = np.log(counts + 1) - log_total
+        dense = [math.log1p(len(text)), math.log1p(len(words)), lengths.mean(), lengths.std(), lengths.max(),
+                 float((lengths >= 7).mean()), text.count(',') / n, len(_punctuation.findall(text)) / n,
+                 log_frequency.mean(), log_frequency.min(), float((counts <= 1).mean())]
+        terms = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+        hashed = [bucket(term, buckets) for term in terms]
+        return dense, hashed
+
+    # Function to turn texts into a standardized dense matrix and (row, bucket, value) triples
+    def features(self, texts, standardize=True):
+        buckets = len(self.hashed_weights)
+        dense = np.empty((len(texts), len(dense_features)), dtype=np.float32)
+        rows, columns, values = [], [], []
+        for i, text in enumerate(texts):
+            dense[i], hashed = self.featurize(text, self.frequencies, self.log_total, buckets)
+            if hashed:
+                rows.extend([i] * len(hashed))
+                columns.extend(hashed)
+                # Each text's n-gram vector has unit norm, so long texts do not dominate
+                values.extend([1 / math.sqrt(len(hashed))] * len(hashed))
+        if standardize:
+            dense = (dense - self.feature_mean) / self.feature_std
+        return dense, np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64), \
+            np.asarray(values, dtype=np.float32)
+
+    def logits(self, dense, rows, columns, values):
+        logits = dense @ self.dense_weights + self.bias
+        np.add.at(logits, rows, self.hashed_weights[columns] * values[:, None])
+        return logits
+
+    # Function to return class probabilities for texts, one row per text
+    def predict_proba(self, texts):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, len(cefr_levels)), dtype=np.float32)
+        logits = self.logits(*self.features(texts))
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def score_texts(self, texts):
+        probabilities = self.predict_proba(texts).tolist()
+        return probabilities_to_levels(probabilities), probabilities
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, dense_weights=self.dense_weights, hashed_weights=self.hashed_weights, bias=self.bias,
+                 feature_mean=self.feature_mean, feature_std=self.feature_std, frequencies=self.frequencies)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        # Read once, so the digest always describes the arrays loaded
+        with open(path, 'rb') as f:
+            data = f.read()
+        with np.load(io.BytesIO(data)) as arrays:
+            classifier = cls(**{name: arrays[name] for name in arrays.files})
+        classifier.digest = hashlib.sha256(data).hexdigest()
+        return classifier
+
+
+# Function to fit the classifier with full-batch Adam on softmax cross-entropy
+def train_classifier(texts, labels, buckets=2**14, frequency_buckets=2**16, epochs=300, learning_rate=0.05,
+                     l2=1e-4, seed=0):
+    """Return a FeatureClassifier fitted to texts and their CEFR labels (e.g. 'B1')."""
+    frequencies = np.zeros(frequency_buckets, dtype=np.int32)
+    for text in texts:
+        np.add.at(frequencies, [bucket(word, frequency_buckets) for word in words_of(text)], 1)
+    rng = np.random.default_rng(seed)
+    classes = len(cefr_levels)
+    model = FeatureClassifier(rng.normal(0, 0.01, (len(dense_features), classes)).astype(np.float32),
+                              np.zeros((buckets, classes), dtype=np.float32), np.zeros(classes, dtype=np.float32),
+                              np.zeros(len(dense_features), dtype=np.float32),
+                              np.ones(len(dense_features), dtype=np.float32), frequencies)
+    dense, rows, columns, values = model.features(texts, standardize=False)
+    model.feature_mean = dense.mean(axis=0)
+    model.feature_std = dense.std(axis=0) + 1e-6
+    dense = (dense - model.feature_mean) / model.feature_std
+    targets = np.eye(classes, dtype=np.float32)[[cefr_levels.index(label) for label in labels]]
+
+    parameters = [model.dense_weights, model.hashed_weights, model.bias]
+    moments = [(np.zeros_like(p), np.zeros_like(p)) for p in parameters]
+    for step in range(1, epochs + 1):
+        logits = model.logits(dense, rows, columns, values)
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        error = (exp / exp.sum(axis=-1, keepdims=True) - targets) / len(texts)
+        hashed_gradient = np.zeros_like(model.hashed_weights)
+        np.add.at(hashed_gradient, columns, error[rows] * values[:, None])
+        gradients = [dense.T @ error + l2 * model.dense_weights, hashed_gradient + l2 * model.hashed_weights,
+                     error.sum(axis=0)]
+        for parameter, gradient, (m, v) in zip(parameters, gradients, moments):
+            m *= 0.9
+            m += 0.1 * gradient
+            v *= 0.999
+            v += 0.001 * gradient ** 2
+            parameter -= learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+    return model
+
+
+# Function to read (sentence, difficulty) pairs from a labelled CSV
+def load_labelled(path=training_data_path):
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = [(row['sentence'], row['difficulty']) for row in csv.DictReader(f)]
+    return [text for text, _ in rows], [label for _, label in rows]
+
+
+# Function to get the shared classifier, reloaded when the saved file changes, or None if it was never trained
+def get_fallback_classifier(path=fallback_model_path):
+    """Return the classifier saved at path by `python fallback_classifier.py`.
+
+    Training takes too long to happen on a page view, so a missing file is logged once and None returned.
+    """
+    global _classifier, _classifier_signature
+    with _classifier_lock:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if path not in _warned_missing:
+                _warned_missing.add(path)
+                logger.warning("No fallback classifier at %s; train one with fallback_classifier.py", path)
+            return None
+        signature = (path, stat.st_size, stat.st_mtime_ns)
+        if _classifier is None or _classifier_signature != signature:
+            _classifier = FeatureClassifier.load(path)
+            _classifier_signature = signature
+        return _classifier
+
+
+class CascadeScorer:
+    """Answers with the feature classifier when it is confident, and escalates the rest to scorer.
+
+    A text is escalated when the classifier's top probability is below threshold, so 0 never
+    escalates and anything above 1 always does. Texts without a single word are always
+    escalated, since their features lie far outside anything the classifier was trained on.
+    """
+
+    def __init__(self, classifier, scorer, threshold=0.8):
+        self.classifier = classifier
+        self.scorer = scorer
+        self.threshold = threshold
+        self.counters = {'calls': 0, 'escalated': 0}
+        self.lock = threading.Lock()
+
+    # Cached predictions depend on the threshold and the classifier as well as the transformer
+    @property
+    def fingerprint(self):
+        inner = getattr(self.scorer, 'fingerprint', None)
+        if inner is None or self.classifier.digest is None:
+            return None
+        return f"{inner}:cascade={self.threshold}:{self.classifier.digest}"
+
+    def score_texts(self, texts):
+        texts = list(texts)
+        if not texts:
+            return [], []
+        with timer('fallback'):
+            probabilities = self.classifier.predict_proba(texts)
+        unsure = probabilities.max(axis=-1) < self.threshold
+        escalated = [i for i, text in enumerate(texts) if unsure[i] or not words_of(text)]
+        probabilities = probabilities.tolist()
+        if escalated:
+            _, scored = self.scorer.score_texts([texts[i] for i in escalated])
+            for i, row in zip(escalated, scored):
+                probabilities[i] = row
+        with self.lock:
+            self.counters['calls'] += len(texts)
+            self.counters['escalated'] += len(escalated)
+        inc('cascade_texts_total', len(texts))
+        inc('cascade_escalated_total', len(escalated))
+        return probabilities_to_levels(probabilities), probabilities
+
+    # Function to report how many texts were scored and the fraction sent to the transformer
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['escalation_rate'] = stats['escalated'] / stats['calls'] if stats['calls'] else 0.0
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the feature-based difficulty classifier and report held-out accuracy.')
+    parser.add_argument('--data', default=training_data_path)
+    parser.add_argument('--output', default=fallback_model_path)
+    parser.add_argument('--validation-fraction', type=float, default=0.1)
+    parser.add_argument('--epochs', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    texts, labels = load_labelled(args.data)
+    order = np.random.default_rng(args.seed).permutation(len(texts))
+    held_out = order[:int(len(texts) * args.validation_fraction)]
+    train_rows = order[len(held_out):]
+    start = time.perf_counter()
+    model = train_classifier([texts[i] for i in train_rows], [labels[i] for i in train_rows],
+                             epochs=args.epochs, seed=args.seed)
+    print(f"trained on {len(train_rows)} sentences in {time.perf_counter() - start:.1f}s")
+    if len(held_out):
+        levels, _ = model.score_texts([texts[i] for i in held_out])
+        accuracy = sum(level == labels[i] for level, i in zip(levels, held_out)) / len(held_out)
+        print(f"held-out accuracy {accuracy:.2%} on {len(held_out)} sentences")
+    # The saved model is refitted on every sentence
+    train_classifier(texts, labels, epochs=args.epochs, seed=args.seed).save(args.output)
+    print(f"saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+# Streaming feed pipeline: fetch -> validate image -> score -> filter by level, one article at a time
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+
+from image_validation import get_image_validator
+from instrumentation import inc, observe
+from prediction_cache import cached_score_texts
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output in the queue to the next stage
+_done = object()
+
+
+# Function to build the text an article is scored on
+def article_text(article):
+    return (article.get('title') or '') + " " + (article.get('description') or '')
+
+
+class FeedPipeline:
+    """Moves articles of one category through bounded stages, yielding each as soon as it is scored.
+
+    Every stage has its own number of workers and hands items on through a queue of at most
+    queue_size, so a slow stage holds back the ones before it instead of buffering without
+    bound. A call slower than its stage timeout drops that item (or page) and the rest move on.
+    The blocking source, validator and scorer run on a private thread pool.
+    """
+
+    def __init__(self, source, scorer, cache=None, validator=None, pages=2, page_size=25, fetch_concurrency=2,
+                 validate_concurrency=16, score_concurrency=1, batch_size=16, queue_size=32, fetch_timeout=10,
+                 validate_timeout=3, score_timeout=10):
+        self.source = source
+        self.scorer = scorer
+        # None looks the scorer's cache up on every batch, so one that cannot be reached yet is retried
+        self.cache = cache
+        self.validator = validator or get_image_validator()
+        self.pages = pages
+        self.page_size = page_size
+        self.concurrency = {'fetch': fetch_concurrency, 'validate': validate_concurrency, 'score': score_concurrency}
+        self.timeouts = {'fetch': fetch_timeout, 'validate': validate_timeout, 'score': score_timeout}
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.pages_fetched = 0
+        self.errors = []
+
+    # Function to run one blocking call on the pool, returning None if it fails or exceeds the stage timeout
+    async def _call(self, executor, stage, function, *args):
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(executor, function, *args),
+                                          self.timeouts[stage])
+        except asyncio.TimeoutError:
+            inc('pipeline_timeouts_total', stage=stage)
+        except Exception as e:
+            logger.warning("Feed pipeline %s stage failed: %s", stage, e)
+            inc('pipeline_errors_total', stage=stage)
+            self.errors.append(f"{stage}: {e}")
+        finally:
+            observe('stage_seconds', time.perf_counter() - start, stage=f'pipeline_{stage}')
+        return None
+
+    # Function to record an article (or a whole stage worker, when article is None) lost to an error
+    def _drop(self, article, stage, error):
+        logger.warning("Feed pipeline %s stage dropped %s: %s", stage,
+                       'an article' if article is not None else 'a worker', error)
+        inc('pipeline_errors_total', stage=stage)
+        self.errors.append(f"{stage}: {error}")
+
+    async def run(self, category, level=None, on_scored=None):
+        """Yield the scored articles of category whose level is level (any level if None).
+
+        on_scored, if given, is called with every scored article before the level filter.
+        """
+        self.pages_fetched = 0
+        self.errors = []
+        pages = asyncio.Queue()
+        for page in range(self.pages):
+            pages.put_nowait(page)
+        to_validate = asyncio.Queue(self.queue_size)
+        to_score = asyncio.Queue(self.queue_size)
+        results = asyncio.Queue(self.queue_size)
+        executor = ThreadPoolExecutor(max_workers=sum(self.concurrency.values()), thread_name_prefix='feed-pipeline')
+
+        async def fetch():
+            while not pages.empty():
+                page = pages.get_nowait()
+                articles = await self._call(executor, 'fetch', self.source.fetch, category,
+                                            page * self.page_size, self.page_size)
+                if articles is None:
+                    continue
+                self.pages_fetched += 1
+                for article in articles:
+                    await to_validate.put(article)
+
+        async def validate():
+            while (article := await to_validate.get()) is not _done:
+                image = article.get('image') if isinstance(article, dict) else None
+                valid = await self._call(executor, 'validate', self.validator.is_valid, image)
+                if valid:
+                    await to_score.put(article)
+                else:
+                    inc('articles_dropped_total', reason='invalid_image' if valid is False else 'validate_timeout')
+
+        async def score():
+            finished = False
+            while not finished:
+                article = await to_score.get()
+                if article is _done:
+                    return
+                # Whatever else is already waiting is scored in the same batch
+                batch = [article]
+                while len(batch) < self.batch_size and not to_score.empty():
+                    article = to_score.get_nowait()
+                    if article is _done:
+                        finished = True
+                        break
+                    batch.append(article)
+                texts = []
+                for article in list(batch):
+                    try:
+                        texts.append(article_text(article))
+                    except Exception as e:
+                        # One malformed article is dropped without holding back the rest of its batch
+                        self._drop(article, 'score', e)
+                        batch.remove(article)
+                if not batch:
+                    continue
+                scored = await self._call(executor, 'score', cached_score_texts, texts, self.scorer, self.cache)
+                if scored is None:
+                    inc('articles_dropped_total', len(batch), reason='score_timeout')
+                    continue
+                for article, article_level, row in zip(batch, *scored):
+                    article['level'] = article_level
+                    article['probabilities'] = row
+                    if on_scored is not None:
+                        try:
+                            on_scored(article)
+                        except Exception as e:
+                            # The article is still shown; only the callback's side effect is lost
+                            logger.warning("Feed pipeline on_scored callback failed: %s", e)
+                            inc('pipeline_errors_total', stage='on_scored')
+                            self.errors.append(f"on_scored: {e}")
+                    if level is None or article_level == level:
+                        await results.put(article)
+                    else:
+                        inc('articles_dropped_total', reason='level_filter')
+
+        # Each stage tells the next one it is finished once all of its workers are, even if one failed
+        async def stage(name, worker, downstream, downstream_workers):
+            try:
+                for result in await asyncio.gather(*(worker() for _ in range(self.concurrency[name])),
+                                                   return_exceptions=True):
+                    if isinstance(result, Exception):
+                        self._drop(None, name, result)
+            finally:
+                for _ in range(downstream_workers):
+                    await downstream.put(_done)
+
+        tasks = [asyncio.create_task(stage('fetch', fetch, to_validate, self.concurrency['validate'])),
+                 asyncio.create_task(stage('validate', validate, to_score, self.concurrency['score'])),
+                 asyncio.create_task(stage('score', score, results, 1))]
+        try:
+            while (article := await results.get()) is not _done:
+                yield article
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Calls abandoned after a timeout finish in the background and are ignored
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Function to iterate a pipeline from synchronous code, running its event loop on a background thread
+def iter_articles(pipeline, category, level=None, on_scored=None):
+    """Yield articles as each one clears the pipeline; closing the iterator stops the pipeline.
+
+    At most pipeline.queue_size articles wait for the caller, so a slow reader holds the pipeline back.
+    """
+    items = queue.Queue(maxsize=pipeline.queue_size)
+    stopped = threading.Event()
+    done = object()
+
+    # Function to hand an item to the reader, giving up once the reader has gone away
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    async def consume():
+        async with aclosing(pipeline.run(category, level, on_scored)) as articles:
+            async for article in articles:
+                if not await asyncio.to_thread(put, article):
+                    return
+
+    def produce():
+        try:
+            asyncio.run(consume())
+            put(done)
+        except BaseException as e:
+            put(e)
+
+    threading.Thread(target=produce, name='feed-pipeline-loop', daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
@@ -0,0 +1,287 @@
+# Fine-tuning CamemBERT on a labelled CSV shaped like data/training_data.csv (id,sentence,difficulty)
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+import time
+from functools import partial
+
+from model_registry import create_tiny_model, load_vocabulary_tokenizer, save_model_directory
+from scoring import cefr_levels, pad_batch, probabilities_to_levels, score_encoded
+from tokenization import PretokenizedCorpus, file_digest, pretokenize
+
+logger = logging.getLogger(__name__)
+
+# Checkpoint directories are named after the optimizer step they were taken at
+_checkpoint_name = re.compile(r'^step-(\d+)$')
+
+# Settings that must match for a checkpoint to be resumed, since they decide the batch order
+resume_settings = ['batch_size', 'accumulation_steps', 'max_length', 'seed', 'validation_fraction', 'data_sha256']
+
+
+# Reads labelled examples from a pre-tokenized corpus, reopening the memory map in each DataLoader worker
+class CorpusDataset:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.corpus = PretokenizedCorpus(prefix)
+
+    def __len__(self):
+        return len(self.corpus)
+
+    def __getitem__(self, i):
+        import numpy as np
+        return np.asarray(self.corpus[i], dtype=np.int64), int(self.corpus.labels[i])
+
+    # Pickle the prefix only, so workers map the files themselves instead of receiving a copy
+    def __getstate__(self):
+        return {'prefix': self.prefix}
+
+    def __setstate__(self, state):
+        self.__init__(state['prefix'])
+
+
+# Function to pad a list of (ids, label) pairs into model inputs
+def collate(items, pad_token_id):
+    import torch
+    input_ids, attention_mask = pad_batch([ids for ids, _ in items], pad_token_id)
+    return input_ids, attention_mask, torch.tensor([label for _, label in items], dtype=torch.long)
+
+
+# Function to build one epoch's batches: shuffled, then length-bucketed within pools of pool_batches batches
+def epoch_batches(lengths, indices, batch_size, seed, epoch, pool_batches=50):
+    """Return a list of batches of corpus positions, the same for the same seed and epoch.
+
+    Sorting inside a shuffled pool keeps padding low while every epoch still sees a new order.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng([seed, epoch])
+    shuffled = rng.permutation(np.asarray(indices))
+    pool_size = batch_size * pool_batches
+    batches = []
+    for start in range(0, len(shuffled), pool_size):
+        pool = shuffled[start:start + pool_size]
+        pool = pool[np.argsort(lengths[pool], kind='stable')]
+        batches.extend(pool[i:i + batch_size].tolist() for i in range(0, len(pool), batch_size))
+    return [batches[i] for i in rng.permutation(len(batches))]
+
+
+# Function to find the newest complete checkpoint in checkpoint_dir
+def latest_checkpoint(checkpoint_dir):
+    if not os.path.isdir(checkpoint_dir):
+        return None
+    steps = [(int(match.group(1)), name) for name in os.listdir(checkpoint_dir)
+             if (match := _checkpoint_name.match(name))
+             and os.path.exists(os.path.join(checkpoint_dir, name, 'trainer_state.json'))]
+    return os.path.join(checkpoint_dir, max(steps)[1]) if steps else None
+
+
+# Function to write a checkpoint (safetensors weights, optimizer and position) and drop the oldest ones
+def save_checkpoint(checkpoint_dir, model, optimizer, scheduler, state, keep=2):
+    import torch
+
+    path = os.path.join(checkpoint_dir, f"step-{state['step']:08d}")
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    model.save_pretrained(tmp_path, safe_serialization=True)
+    torch.save({'optimizer': optimizer.state_dict(), 'scheduler': scheduler.state_dict(),
+                'rng': torch.get_rng_state()}, os.path.join(tmp_path, 'optimizer.pt'))
+    with open(os.path.join(tmp_path, 'trainer_state.json'), 'w') as f:
+        json.dump(state, f)
+    # Renamed into place only once complete, so a crash never leaves a half-written checkpoint
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    names = sorted(name for name in os.listdir(checkpoint_dir) if _checkpoint_name.match(name))
+    for name in names[:-keep]:
+        shutil.rmtree(os.path.join(checkpoint_dir, name), ignore_errors=True)
+    return path
+
+
+# Function to check whether the corpus at prefix was tokenized from data_path as it is now
+def corpus_is_current(prefix, data_path, tokenizer, max_length):
+    try:
+        with open(prefix + '.json') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    source = os.stat(data_path)
+    if (meta['source'], meta['max_length'], meta['vocab_size'], meta.get('source_size')) != \
+            (os.path.abspath(data_path), max_length, len(tokenizer), source.st_size):
+        return False
+    # A file that was only touched keeps its corpus; one edited in place within the same size does not
+    return meta.get('source_mtime_ns') == source.st_mtime_ns or meta.get('source_sha256') == file_digest(data_path)
+
+
+# Function to pre-tokenize the training CSV once, reusing the files of an earlier run unless refresh
+def prepare_corpus(data_path, prefix, tokenizer, max_length, refresh=False):
+    if not refresh and corpus_is_current(prefix, data_path, tokenizer, max_length):
+        corpus = PretokenizedCorpus(prefix)
+    else:
+        corpus = pretokenize(data_path, prefix, tokenizer, max_length)
+    if corpus.labels is None:
+        raise ValueError(f"{data_path} has no difficulty column to train on.")
+    return corpus
+
+
+# Function to measure exact-level accuracy on the held-out positions
+def evaluate(model, corpus, indices, pad_token_id, batch_size):
+    if not len(indices):
+        return None
+    model.eval()
+    probabilities = score_encoded(corpus.encoded(indices), model, pad_token_id, batch_size)
+    predicted = probabilities_to_levels(probabilities)
+    model.train()
+    return sum(level == cefr_levels[corpus.labels[i]] for level, i in zip(predicted, indices)) / len(indices)
+
+
+def train(data_path, output_dir, base='camembert-base', epochs=3, batch_size=16, accumulation_steps=2,
+          learning_rate=5e-5, weight_decay=0.01, warmup_ratio=0.1, max_length=256, workers=2,
+          checkpoint_every=200, keep_checkpoints=2, validation_fraction=0.1, seed=42, resume=True):
+    """Fine-tune base on data_path and export the result to output_dir in the layout get_model loads.
+
+    Checkpoints go to <output_dir>.ckpt every checkpoint_every optimizer steps and at the end of
+    every epoch; with resume, training continues from the newest one at the batch it stopped at.
+    """
+    import numpy as np
+    import torch
+    from torch.utils.data import DataLoader
+    from transformers import CamembertForSequenceClassification, get_linear_schedule_with_warmup
+
+    checkpoint_dir = output_dir.rstrip('/') + '.ckpt'
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    tokenizer = load_vocabulary_tokenizer()
+    prefix = os.path.join(checkpoint_dir, 'corpus')
+    corpus = prepare_corpus(data_path, prefix, tokenizer, max_length, refresh=not resume)
+    settings = {'batch_size': batch_size, 'accumulation_steps': accumulation_steps, 'max_length': max_length,
+                'seed': seed, 'validation_fraction': validation_fraction, 'data_sha256': corpus.meta['source_sha256']}
+    dataset = CorpusDataset(prefix)
+    lengths = np.asarray(corpus.lengths())
+
+    order = np.random.default_rng(seed).permutation(len(corpus))
+    validation_size = int(len(corpus) * validation_fraction)
+    validation_indices = sorted(order[:validation_size].tolist())
+    train_indices = order[validation_size:]
+    batches_per_epoch = math.ceil(len(train_indices) / batch_size)
+    steps_per_epoch = math.ceil(batches_per_epoch / accumulation_steps)
+
+    if not resume:
+        # Older checkpoints would otherwise outrank the new run's when it is resumed
+        for name in os.listdir(checkpoint_dir):
+            if _checkpoint_name.match(name.removesuffix('.tmp')):
+                shutil.rmtree(os.path.join(checkpoint_dir, name), ignore_errors=True)
+    checkpoint = latest_checkpoint(checkpoint_dir)
+    state = {'epoch': 0, 'batch': 0, 'step': 0, 'history': [], **settings}
+    if checkpoint:
+        with open(os.path.join(checkpoint, 'trainer_state.json')) as f:
+            state = json.load(f)
+        changed = [name for name in resume_settings if state.get(name) != settings[name]]
+        if changed:
+            raise ValueError(f"Cannot resume {checkpoint}: {', '.join(changed)} changed; pass --restart to start over.")
+        logger.info('resuming from %s (epoch %d, batch %d)', checkpoint, state['epoch'] + 1, state['batch'])
+
+    torch.manual_seed(seed)
+    model = CamembertForSequenceClassification.from_pretrained(
+        checkpoint or base, num_labels=len(cefr_levels), id2label=dict(enumerate(cefr_levels)),
+        label2id={level: i for i, level in enumerate(cefr_levels)})
+    model.train()
+    # Biases and LayerNorm weights are not decayed
+    decayed = [p for name, p in model.named_parameters() if not name.endswith('bias') and 'LayerNorm' not in name]
+    not_decayed = [p for name, p in model.named_parameters() if name.endswith('bias') or 'LayerNorm' in name]
+    optimizer = torch.optim.AdamW([{'params': decayed, 'weight_decay': weight_decay},
+                                   {'params': not_decayed, 'weight_decay': 0.0}], lr=learning_rate)
+    total_steps = steps_per_epoch * epochs
+    scheduler = get_linear_schedule_with_warmup(optimizer, int(total_steps * warmup_ratio), total_steps)
+    if checkpoint:
+        saved = torch.load(os.path.join(checkpoint, 'optimizer.pt'), weights_only=False)
+        optimizer.load_state_dict(saved['optimizer'])
+        scheduler.load_state_dict(saved['scheduler'])
+        torch.set_rng_state(saved['rng'])
+
+    def checkpoint_now():
+        save_checkpoint(checkpoint_dir, model, optimizer, scheduler, state, keep_checkpoints)
+
+    for epoch in range(state['epoch'], epochs):
+        batches = epoch_batches(lengths, train_indices, batch_size, seed, epoch)
+        loader = DataLoader(dataset, batch_sampler=batches[state['batch']:], num_workers=workers,
+                            collate_fn=partial(collate, pad_token_id=tokenizer.pad_token_id))
+        start = time.perf_counter()
+        samples = tokens = 0
+        loss_sum = 0.0
+        for batch_number, (input_ids, attention_mask, labels) in enumerate(loader, start=state['batch']):
+            # The last group of an epoch may be short, so its loss is averaged over what it holds
+            group_size = min(accumulation_steps, batches_per_epoch - batch_number // accumulation_steps * accumulation_steps)
+            loss = model(input_ids=input_ids, attention_mask=attention_mask, labels=labels).loss
+            (loss / group_size).backward()
+            samples += len(labels)
+            tokens += int(attention_mask.sum())
+            loss_sum += loss.item() * len(labels)
+            if (batch_number + 1) % accumulation_steps and batch_number + 1 < batches_per_epoch:
+                continue
+            torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+            optimizer.step()
+            scheduler.step()
+            optimizer.zero_grad(set_to_none=True)
+            state['step'] += 1
+            state['batch'] = batch_number + 1
+            if state['step'] % checkpoint_every == 0 and state['batch'] < batches_per_epoch:
+                checkpoint_now()
+        seconds = time.perf_counter() - start
+        accuracy = evaluate(model, corpus, validation_indices, tokenizer.pad_token_id, batch_size * 2)
+        report = {'epoch': epoch + 1, 'samples': samples, 'seconds': seconds,
+                  'samples_per_second': samples / seconds if seconds else 0.0,
+                  'tokens_per_second': tokens / seconds if seconds else 0.0,
+                  'loss': loss_sum / samples if samples else None, 'validation_accuracy': accuracy}
+        state['history'].append(report)
+        state['epoch'], state['batch'] = epoch + 1, 0
+        checkpoint_now()
+        logger.info('epoch %d/%d: %d samples in %.1fs, %.1f samples/sec, %.0f tokens/sec, loss %.4f, '
+                    'validation accuracy %s', epoch + 1, epochs, samples, seconds, report['samples_per_second'],
+                    report['tokens_per_second'], report['loss'] or 0.0,
+                    'n/a' if accuracy is None else f'{accuracy:.3f}')
+
+    model.eval()
+    save_model_directory(model, tokenizer, output_dir)
+    return state['history']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fine-tune CamemBERT on a CSV of sentences labelled with CEFR levels.')
+    parser.add_argument('data', help='CSV with sentence and difficulty columns, e.g. data/training_data.csv')
+    parser.add_argument('output', help='Directory to export the fine-tuned model to (MODEL_DIR layout)')
+    parser.add_argument('--base', default='camembert-base',
+                        help='Model to start from: a Hugging Face name or a model directory such as app/')
+    parser.add_argument('--tiny', action='store_true', help='Start from the tiny random model (offline smoke runs)')
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--accumulation-steps', type=int, default=2, help='Batches per optimizer step')
+    parser.add_argument('--learning-rate', type=float, default=5e-5)
+    parser.add_argument('--weight-decay', type=float, default=0.01)
+    parser.add_argument('--warmup-ratio', type=float, default=0.1)
+    parser.add_argument('--max-length', type=int, default=256)
+    parser.add_argument('--workers', type=int, default=2, help='DataLoader worker processes')
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    parser.add_argument('--checkpoint-every', type=int, default=200, help='Optimizer steps between checkpoints')
+    parser.add_argument('--keep-checkpoints', type=int, default=2)
+    parser.add_argument('--validation-fraction', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--restart', action='store_true', help='Ignore any checkpoint and start from the base model')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+    base = create_tiny_model(os.path.join(tempfile.gettempdir(), 'cefr-tiny-model')) if args.tiny else args.base
+    history = train(args.data, args.output, base, args.epochs, args.batch_size, args.accumulation_steps,
+                    args.learning_rate, args.weight_decay, args.warmup_ratio, args.max_length, args.workers,
+                    args.checkpoint_every, args.keep_checkpoints, args.validation_fraction, args.seed,
+                    resume=not args.restart)
+    print(json.dumps(history, indent=2))
+
+
+if __name__ == '__main__':
+    main()
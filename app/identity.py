@@ -0,0 +1,50 @@
+# Durable learner ids: random ids signed with a server secret, kept in a browser cookie
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Name and lifetime of the cookie holding the signed learner id
+cookie_name = os.getenv('USER_COOKIE_NAME', 'ouioui_learner')
+cookie_max_age = 365 * 24 * 3600
+
+_secret_lock = threading.Lock()
+_secret = None
+
+
+# Function to get the key learner ids are signed with; every replica must share USER_ID_SECRET
+def identity_secret():
+    global _secret
+    with _secret_lock:
+        if _secret is None:
+            configured = os.getenv('USER_ID_SECRET')
+            if configured:
+                _secret = configured.encode('utf-8')
+            else:
+                logger.warning("USER_ID_SECRET is not set; learner cookies will not survive a restart "
+                               "or be accepted by other replicas")
+                _secret = secrets.token_bytes(32)
+        return _secret
+
+
+def new_user_id():
+    return secrets.token_hex(16)
+
+
+# Function to turn a learner id into the token stored in the cookie: '<id>.<HMAC-SHA256 of id>'
+def sign_user_id(user_id, secret=None):
+    signature = hmac.new(secret or identity_secret(), user_id.encode('utf-8'), hashlib.sha256).hexdigest()
+    return f"{user_id}.{signature}"
+
+
+# Function to get the learner id from a cookie token, or None if it is missing or was not signed by us
+def verify_token(token, secret=None):
+    user_id, _, signature = (token or '').rpartition('.')
+    if not user_id:
+        return None
+    expected = sign_user_id(user_id, secret).rpartition('.')[2]
+    return user_id if hmac.compare_digest(signature, expected) else None
@@ -0,0 +1,91 @@
+# Concurrent image URL validation with a pooled HTTP session and a TTL cache
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import inc, timer
+
+_validator_lock = threading.Lock()
+_validator = None
+
+
+class ImageValidator:
+    """Check image URLs with HEAD requests in a thread pool, remembering results for ttl seconds."""
+
+    def __init__(self, ttl=600, max_workers=16, timeout=5):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-validator')
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    # Function to check a single URL over the network
+    def check(self, url):
+        try:
+            response = self.session.head(url, timeout=self.timeout)
+        except requests.RequestException:
+            inc('http_errors_total', source='image')
+            return False
+        if response.status_code >= 400:
+            inc('http_errors_total', source='image')
+        return response.status_code == 200 and 'image' in response.headers.get('Content-Type', '')
+
+    def _cached(self, url, now):
+        entry = self.cache.get(url)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        return None
+
+    # Function to validate many URLs at once, returning {url: is_valid}
+    def validate_many(self, urls):
+        now = time.monotonic()
+        results = {}
+        pending = []
+        with self.lock:
+            for url in dict.fromkeys(urls):
+                if url is None:
+                    results[url] = False
+                    continue
+                cached = self._cached(url, now)
+                if cached is None:
+                    pending.append(url)
+                else:
+                    results[url] = cached
+        inc('image_cache_hits_total', len(results))
+        inc('image_cache_misses_total', len(pending))
+        if pending:
+            with timer('image_validation'):
+                checked = list(self.executor.map(self.check, pending))
+            expires_at = time.monotonic() + self.ttl
+            with self.lock:
+                # Failed checks are cached too so a dead host is not retried on every rerun
+                for url, valid in zip(pending, checked):
+                    self.cache[url] = (valid, expires_at)
+                    results[url] = valid
+                self._prune(time.monotonic())
+        return results
+
+    # Function to validate a single URL
+    def is_valid(self, url):
+        return self.validate_many([url])[url]
+
+    def _prune(self, now):
+        expired = [url for url, (_, expires_at) in self.cache.items() if expires_at <= now]
+        for url in expired:
+            del self.cache[url]
+
+
+# Function to get the validator shared by every session in this process
+def get_image_validator():
+    global _validator
+    with _validator_lock:
+        if _validator is None:
+            _validator = ImageValidator()
+        return _validator
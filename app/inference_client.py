@@ -0,0 +1,65 @@
+# Thin client for the local inference service in inference_server.py
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scoring import probabilities_to_levels
+
+logger = logging.getLogger(__name__)
+
+# How long the fingerprint reported by the service is trusted before it is asked again
+fingerprint_ttl = 60
+# How soon to ask again when the service is unreachable or still loading its model
+fingerprint_retry = 5
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+class InferenceClient:
+    """Score texts through the inference service; a drop-in replacement for LocalScorer."""
+
+    def __init__(self, url, timeout=30, pool_size=8):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+
+    def score_texts(self, texts):
+        texts = list(texts)
+        if not texts:
+            return [], []
+        response = self.session.post(f"{self.url}/predict", json={'texts': texts}, timeout=self.timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"Inference service returned status {response.status_code}: {response.text}")
+        probabilities = response.json()['probabilities']
+        return probabilities_to_levels(probabilities), probabilities
+
+    def health(self, timeout=None):
+        return self.session.get(f"{self.url}/health", timeout=timeout or self.timeout).json()
+
+    # Function to get the fingerprint of the model the service scores with
+    def model_fingerprint(self):
+        fingerprint = self.health(timeout=5).get('model_fingerprint')
+        if not fingerprint:
+            raise RuntimeError(f"Inference service at {self.url} has no model loaded yet.")
+        return fingerprint
+
+    # The served model's fingerprint, shared by every client of the same service and refreshed every fingerprint_ttl
+    @property
+    def fingerprint(self):
+        """None while the service cannot say, so predictions go uncached until it can instead of failing."""
+        with _fingerprints_lock:
+            cached = _fingerprints.get(self.url)
+        if cached is None or cached[1] <= time.monotonic():
+            try:
+                cached = (self.model_fingerprint(), time.monotonic() + fingerprint_ttl)
+            except (requests.RequestException, RuntimeError, ValueError) as e:
+                logger.warning("No model fingerprint from the inference service at %s, not caching: %s", self.url, e)
+                cached = (None, time.monotonic() + fingerprint_retry)
+            with _fingerprints_lock:
+                _fingerprints[self.url] = cached
+        return cached[0]
@@ -0,0 +1,245 @@
+# Local multi-process inference service with dynamic batching
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_registry import model_dir
+
+logger = logging.getLogger(__name__)
+
+
+# Function run by each worker process: load the model once, then score batches until told to stop
+def worker_main(directory, backend, threads, batch_size, batches, results):
+    import torch
+    from backends import get_backend
+
+    # Each worker owns a fixed share of the cores so workers do not oversubscribe the CPU
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    # The batcher never sends more than batch_size texts, so each batch is scored in one forward pass per bucket
+    scorer = get_backend(backend, directory, batch_size=batch_size)
+    # Clients key their prediction caches on the model actually served
+    results.put(('ready', os.getpid(), scorer.fingerprint))
+    while True:
+        item = batches.get()
+        if item is None:
+            return
+        batch_id, texts = item
+        try:
+            _, probabilities = scorer.score_texts(texts)
+            results.put(('done', batch_id, probabilities))
+        except Exception as e:
+            results.put(('error', batch_id, repr(e)))
+
+
+class DynamicBatcher:
+    """Coalesce concurrent scoring requests into batches dispatched to a pool of worker processes."""
+
+    def __init__(self, directory=model_dir, backend=None, workers=None, threads_per_worker=1, max_batch_size=32, max_wait_ms=5):
+        self.threads_per_worker = threads_per_worker
+        self.workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        # A request that did not fit in the last batch, dispatched first in the next one
+        self.held = None
+        self.model_fingerprint = None
+        self.in_flight = {}
+        self.free_workers = threading.Semaphore(self.workers)
+        self.batch_ids = itertools.count()
+        self.stats = {'requests': 0, 'batches': 0, 'texts': 0, 'errors': 0}
+        self.ready = threading.Event()
+        context = multiprocessing.get_context('spawn')
+        self.batches = context.Queue()
+        self.results = context.Queue()
+        self.processes = [context.Process(target=worker_main, name=f'inference-worker-{i}', daemon=True,
+                                          args=(directory, backend, threads_per_worker, max_batch_size,
+                                                self.batches, self.results))
+                          for i in range(self.workers)]
+        for process in self.processes:
+            process.start()
+        threading.Thread(target=self._dispatch, name='inference-batcher', daemon=True).start()
+        threading.Thread(target=self._collect, name='inference-collector', daemon=True).start()
+
+    # Function to queue texts for scoring, returning a Future of their probabilities
+    def submit(self, texts):
+        """Requests larger than max_batch_size are split into parts that are batched separately."""
+        texts = list(texts)
+        parts = [texts[i:i + self.max_batch_size] for i in range(0, len(texts), self.max_batch_size)]
+        futures = [Future() for _ in parts]
+        for part, future in zip(parts, futures):
+            self.pending.put((part, future))
+        if len(futures) == 1:
+            return futures[0]
+        combined = Future()
+        lock = threading.Lock()
+        remaining = [len(futures)]
+
+        def part_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] or combined.done():
+                    return
+            errors = [future.exception() for future in futures if future.exception() is not None]
+            if errors:
+                combined.set_exception(errors[0])
+            else:
+                combined.set_result([row for future in futures for row in future.result()])
+
+        if not futures:
+            combined.set_result([])
+        for future in futures:
+            future.add_done_callback(part_done)
+        return combined
+
+    # Gather requests until the next one would overflow the batch or the oldest has waited max_wait
+    def _next_batch(self):
+        requests_in_batch = [self.held or self.pending.get()]
+        self.held = None
+        size = len(requests_in_batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                texts, future = self.pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(texts) > self.max_batch_size:
+                self.held = (texts, future)
+                break
+            requests_in_batch.append((texts, future))
+            size += len(texts)
+        return requests_in_batch
+
+    def _dispatch(self):
+        while True:
+            # Only form a batch once a worker is free, so requests keep coalescing while all are busy
+            self.free_workers.acquire()
+            requests_in_batch = self._next_batch()
+            batch_id = next(self.batch_ids)
+            self.in_flight[batch_id] = requests_in_batch
+            texts = [text for request_texts, _ in requests_in_batch for text in request_texts]
+            self.stats['requests'] += len(requests_in_batch)
+            self.stats['batches'] += 1
+            self.stats['texts'] += len(texts)
+            self.batches.put((batch_id, texts))
+
+    def _collect(self):
+        ready_workers = 0
+        while True:
+            kind, batch_id, payload = self.results.get()
+            if kind == 'ready':
+                self.model_fingerprint = payload
+                ready_workers += 1
+                if ready_workers == self.workers:
+                    self.ready.set()
+                continue
+            self.free_workers.release()
+            requests_in_batch = self.in_flight.pop(batch_id)
+            if kind == 'error':
+                self.stats['errors'] += 1
+                for _, future in requests_in_batch:
+                    future.set_exception(RuntimeError(payload))
+                continue
+            offset = 0
+            for texts, future in requests_in_batch:
+                future.set_result(payload[offset:offset + len(texts)])
+                offset += len(texts)
+
+    def describe(self):
+        stats = dict(self.stats)
+        stats.update({'ready': self.ready.is_set(), 'workers': self.workers,
+                      'threads_per_worker': self.threads_per_worker, 'max_batch_size': self.max_batch_size,
+                      'max_wait_ms': self.max_wait * 1000, 'model_fingerprint': self.model_fingerprint,
+                      'mean_batch_size': stats['texts'] / stats['batches'] if stats['batches'] else 0.0})
+        return stats
+
+    def close(self):
+        for _ in self.processes:
+            self.batches.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+
+
+class InferenceHTTPServer(ThreadingHTTPServer):
+    # Many clients connect at once under load and the default backlog of 5 makes them retry after a second
+    request_queue_size = 128
+
+
+def make_handler(batcher, timeout):
+    class InferenceHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._reply(200 if batcher.ready.is_set() else 503, batcher.describe())
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._reply(404, {'error': 'not found'})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                texts = [str(text) for text in body['texts']]
+            except (ValueError, KeyError, TypeError):
+                self._reply(400, {'error': "expected a JSON body like {\"texts\": [...]}"})
+                return
+            try:
+                probabilities = batcher.submit(texts).result(timeout=timeout) if texts else []
+            except Exception as e:
+                self._reply(500, {'error': str(e)})
+                return
+            self._reply(200, {'probabilities': probabilities})
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return InferenceHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve difficulty predictions over HTTP with dynamic batching.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--model-dir', default=model_dir)
+    parser.add_argument('--backend', default=None, help='Inference backend (default: INFERENCE_BACKEND or torch)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: cores / threads per worker)')
+    parser.add_argument('--threads-per-worker', type=int, default=1, help='torch intra-op threads in each worker')
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--timeout', type=float, default=30, help='Seconds a request may wait for its result')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    batcher = DynamicBatcher(args.model_dir, args.backend, args.workers, args.threads_per_worker, args.max_batch_size, args.max_wait_ms)
+    server = InferenceHTTPServer((args.host, args.port), make_handler(batcher, args.timeout))
+    logger.info("Serving on http://%s:%d with %d workers", args.host, args.port, batcher.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+# Background article ingestion into a pre-scored (category, level) feed index
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from feed_pipeline import FeedPipeline, iter_articles
+from instrumentation import inc, timer
+from model_registry import get_scorer
+from scoring import cefr_levels
+
+logger = logging.getLogger(__name__)
+
+# Categories offered in the app, in the order they are shown
+news_categories = ['general', 'business', 'technology', 'entertainment', 'sports', 'science', 'health']
+
+_feed_lock = threading.Lock()
+_feed = None
+
+
+# Fetch news articles from the mediastack API
+class MediastackSource:
+    base_url = "http://api.mediastack.com/v1/news"
+
+    def __init__(self, api_key, session=None):
+        self.api_key = api_key
+        self.session = session or requests.Session()
+
+    def fetch(self, category, offset=0, limit=25):
+        params = {
+            'access_key': self.api_key,
+            'languages': "fr",
+            'categories': category,
+            'offset': offset,
+            'limit': limit
+        }
+        with timer('fetch_news'):
+            try:
+                response = self.session.get(self.base_url, params=params, timeout=10)
+            except requests.RequestException:
+                inc('http_errors_total', source='mediastack')
+                raise
+        if response.status_code != 200:
+            inc('http_errors_total', source='mediastack')
+            raise RuntimeError(f"mediastack returned status {response.status_code} for '{category}'.")
+        return response.json()['data']
+
+
+# Serve articles from a local JSON file shaped like mediastack's 'data' list
+class JsonFixtureSource:
+    def __init__(self, path):
+        with open(path, encoding='utf-8') as f:
+            self.articles = json.load(f)
+
+    def fetch(self, category, offset=0, limit=25):
+        if isinstance(self.articles, dict):
+            articles = self.articles.get(category, [])
+        else:
+            articles = [article for article in self.articles if article.get('category') == category]
+        return articles[offset:offset + limit]
+
+
+# Function to pick the article source from the environment
+def default_source():
+    fixture_path = os.getenv('NEWS_FIXTURE_PATH')
+    if fixture_path:
+        return JsonFixtureSource(fixture_path)
+    return MediastackSource(os.getenv('MEDIASTACK_API_KEY'))
+
+
+class FeedIndex:
+    """Scored articles keyed by (category, level); lookups return a ready-made tuple."""
+
+    def __init__(self, max_per_key=50):
+        self.max_per_key = max_per_key
+        self.entries = {}
+        self.refreshed = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    # Function to add scored articles, newest first, skipping URLs already indexed
+    def add(self, category, articles):
+        grouped = {}
+        for article in articles:
+            if article.get('level') in cefr_levels:
+                grouped.setdefault(article['level'], []).append(article)
+        with self.lock:
+            for level, new_articles in grouped.items():
+                current = self.entries.get((category, level), ())
+                seen = {article.get('url') for article in new_articles}
+                kept = [article for article in current if article.get('url') not in seen]
+                self.entries[(category, level)] = tuple(new_articles + kept)[:self.max_per_key]
+
+    # Function to record the outcome of a refresh of one category
+    def mark_refreshed(self, category, error=None):
+        with self.lock:
+            self.refreshed[category] = time.time()
+            self.errors[category] = error
+
+    def get(self, category, level):
+        return self.entries.get((category, level), ())
+
+    # Function to rank a category's articles by distance to a level position, from their stored probabilities
+    def near(self, category, position, k=20, max_distance=0.75, calibrate=None):
+        """Return up to k articles within max_distance of position (0 for A1 ... 5 for C2), closest first.
+
+        calibrate maps expected levels onto the labelled scale, e.g. EmbeddingIndex.calibrate.
+        """
+        articles = [article for level in cefr_levels for article in self.entries.get((category, level), ())]
+        if not articles:
+            return ()
+        expected = [sum(i * p for i, p in enumerate(article['probabilities'])) for article in articles]
+        positions = calibrate(expected) if calibrate is not None else expected
+        ranked = sorted((abs(float(p) - position), i) for i, p in enumerate(positions))
+        return tuple(articles[i] for distance, i in ranked[:k] if distance <= max_distance)
+
+    # Function to count the indexed articles of a category across all levels
+    def category_size(self, category):
+        return sum(len(self.entries.get((category, level), ())) for level in cefr_levels)
+
+    def is_ready(self, category):
+        return category in self.refreshed
+
+    def last_error(self, category):
+        return self.errors.get(category)
+
+    def counts(self):
+        return {f"{category}/{level}": len(articles) for (category, level), articles in self.entries.items()}
+
+
+class IngestionWorker(threading.Thread):
+    """Pull pages of every category, score them in batches and publish them to a FeedIndex.
+
+    Every category is refreshed each interval seconds. Categories whose refresh failed are
+    retried sooner, after retry_delay seconds doubling up to max_retry_delay.
+    """
+
+    def __init__(self, index, source=None, categories=news_categories, pages=2, page_size=25,
+                 interval=900, scorer_loader=get_scorer, cache=None, validator=None, retry_delay=15,
+                 max_retry_delay=240):
+        super().__init__(name='article-ingestion', daemon=True)
+        self.index = index
+        self.source = source or default_source()
+        self.categories = list(categories)
+        self.pages = pages
+        self.page_size = page_size
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.scorer_loader = scorer_loader
+        self.cache = cache
+        self.validator = validator
+        self.stopped = threading.Event()
+
+    # Function to refresh one category from the source, indexing each article as soon as it is scored
+    def ingest_category(self, category, scorer):
+        pipeline = FeedPipeline(self.source, scorer, self.cache, self.validator, pages=self.pages,
+                                page_size=self.page_size)
+        for article in iter_articles(pipeline, category):
+            self.index.add(category, [article])
+        if not pipeline.pages_fetched and pipeline.errors:
+            raise RuntimeError(pipeline.errors[0])
+
+    # Function to refresh every category (or only the given ones) once, returning those that failed
+    def run_once(self, categories=None):
+        categories = list(categories or self.categories)
+        try:
+            scorer = self.scorer_loader()
+        except Exception as e:
+            logger.exception("Failed to load the scorer for ingestion")
+            for category in categories:
+                self.index.mark_refreshed(category, error=str(e))
+            return categories
+        failed = []
+        for category in categories:
+            if self.stopped.is_set():
+                break
+            try:
+                self.ingest_category(category, scorer)
+                self.index.mark_refreshed(category)
+            except Exception as e:
+                logger.exception("Failed to ingest category '%s'", category)
+                self.index.mark_refreshed(category, error=str(e))
+                failed.append(category)
+        return failed
+
+    def run(self):
+        while not self.stopped.is_set():
+            next_refresh = time.monotonic() + self.interval
+            try:
+                failed = self.run_once()
+            except Exception:
+                logger.exception("Article ingestion pass failed")
+                failed = list(self.categories)
+            # Failures (model still loading, source or service briefly down) are retried before the next refresh
+            delay = self.retry_delay
+            while failed and time.monotonic() + delay < next_refresh:
+                if self.stopped.wait(delay):
+                    return
+                try:
+                    failed = self.run_once(failed)
+                except Exception:
+                    logger.exception("Article ingestion retry failed")
+                delay = min(delay * 2, self.max_retry_delay)
+            self.stopped.wait(max(next_refresh - time.monotonic(), 0))
+
+    def stop(self):
+        self.stopped.set()
+
+
+# Function to get the feed index shared by the whole process, starting ingestion on first use
+def get_feed():
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            index = FeedIndex()
+            IngestionWorker(index, interval=int(os.getenv('INGESTION_INTERVAL', '900'))).start()
+            _feed = index
+        return _feed
+
+
+# Function to stream a category that is not indexed yet straight from the source, for one page view
+def stream_feed(category, level, index=None, pages=1):
+    """Yield the articles of category at level as each one is scored, indexing every scored article."""
+    index = index or get_feed()
+    pipeline = FeedPipeline(default_source(), get_scorer(), pages=pages)
+    yield from iter_articles(pipeline, category, level, on_scored=lambda article: index.add(category, [article]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run one ingestion pass and print the feed index.')
+    parser.add_argument('--fixture', help='Read articles from a local JSON file instead of mediastack')
+    parser.add_argument('--pages', type=int, default=1)
+    parser.add_argument('--page-size', type=int, default=25)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    source = JsonFixtureSource(args.fixture) if args.fixture else None
+    index = FeedIndex()
+    start = time.perf_counter()
+    IngestionWorker(index, source=source, pages=args.pages, page_size=args.page_size).run_once()
+    print(json.dumps(index.counts(), indent=2))
+    print(f"ingested in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
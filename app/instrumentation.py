@@ -0,0 +1,255 @@
+# Lightweight hot-path instrumentation: stage timers, counters, histograms and an optional profiler
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds by metric name; stage timers use latency_buckets
+latency_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+histogram_buckets = {
+    'batch_size': (1, 2, 4, 8, 16, 32, 64, 128),
+    'token_length': (8, 16, 32, 64, 128, 256, 512),
+}
+
+_enabled = os.getenv('METRICS_ENABLED', '0') == '1'
+_profiling = os.getenv('PROFILING_ENABLED', '0') == '1'
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_profilers = []
+# Bumped on every profiling start and stop, so each cycle records into fresh, registered profilers
+_profile_generation = 0
+# Outermost stages currently recording into a profiler; stop_profiling waits on _stages_left until it is zero
+_active_profiled_stages = 0
+_stages_left = threading.Condition(_lock)
+_thread_state = threading.local()
+_started = set()
+
+
+# Function to switch metric collection on or off at runtime
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled():
+    return _enabled
+
+
+# Function to add to a counter, e.g. inc('http_errors_total', source='mediastack')
+def inc(name, value=1, **labels):
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+# Function to record one observation in a histogram
+def observe(name, value, **labels):
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    bounds = histogram_buckets.get(name, latency_buckets)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'bounds': bounds, 'counts': [0] * (len(bounds) + 1), 'sum': 0.0, 'count': 0}
+        index = 0
+        while index < len(bounds) and value > bounds[index]:
+            index += 1
+        histogram['counts'][index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _StageTimer:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        depth = getattr(_thread_state, 'depth', 0)
+        _thread_state.depth = depth + 1
+        # Only the outermost stage of a thread drives the profiler so nested stages are not double counted
+        self.profiler = _begin_profiled_stage() if _profiling and depth == 0 else None
+        if self.profiler is not None:
+            self.profiler.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe('stage_seconds', time.perf_counter() - self.start, stage=self.stage)
+        if self.profiler is not None:
+            self.profiler.disable()
+            _end_profiled_stage()
+        _thread_state.depth -= 1
+        return False
+
+
+# Function to time a stage: `with timer('forward'): ...`; a shared no-op when neither metrics nor profiling are on
+def timer(stage):
+    return _StageTimer(stage) if _enabled or _profiling else _null_timer
+
+
+# Function to get this thread's profiler for the current cycle and count the stage as active, or None once stopped
+def _begin_profiled_stage():
+    global _active_profiled_stages
+    with _lock:
+        # Checked under the lock so a stage never starts recording after stop_profiling has begun waiting
+        if not _profiling:
+            return None
+        profiler = getattr(_thread_state, 'profiler', None)
+        if profiler is None or _thread_state.generation != _profile_generation:
+            profiler = _thread_state.profiler = cProfile.Profile()
+            _thread_state.generation = _profile_generation
+            _profilers.append(profiler)
+        _active_profiled_stages += 1
+        return profiler
+
+
+def _end_profiled_stage():
+    global _active_profiled_stages
+    with _lock:
+        _active_profiled_stages -= 1
+        if not _active_profiled_stages:
+            _stages_left.notify_all()
+
+
+# Function to start profiling timed stages with cProfile (py-spy can instead attach to the process at any time)
+def start_profiling():
+    global _profiling, _profile_generation
+    with _lock:
+        _profile_generation += 1
+        _profiling = True
+
+
+# Function to stop profiling and write the merged stats of every thread to a pstats file
+def stop_profiling(path='profile.pstats'):
+    global _profiling, _profile_generation
+    with _lock:
+        _profiling = False
+        _profile_generation += 1
+        # Stages already inside a profiler finish before its stats are read
+        _stages_left.wait_for(lambda: not _active_profiled_stages)
+        profilers = list(_profilers)
+        _profilers.clear()
+    if not profilers:
+        return None
+    stats = pstats.Stats(profilers[0])
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+    stats.dump_stats(path)
+    return path
+
+
+# Function to take a JSON-friendly copy of every metric
+def snapshot():
+    with _lock:
+        counters = [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in _counters.items()]
+        histograms = [{'name': name, 'labels': dict(labels), 'buckets': list(h['bounds']), 'counts': list(h['counts']),
+                       'sum': h['sum'], 'count': h['count']} for (name, labels), h in _histograms.items()]
+    return {'timestamp': time.time(), 'counters': counters, 'histograms': histograms}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+# Function to render every metric in the Prometheus text exposition format
+def render_prometheus():
+    lines = []
+    with _lock:
+        for (name, labels), value in sorted(_counters.items()):
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), h in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, count in zip(list(h['bounds']) + ['+Inf'], h['counts']):
+                cumulative += count
+                bucket_labels = labels + (('le', bound),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {h['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {h['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def _reply(self, body, content_type):
+        payload = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._reply(render_prometheus(), 'text/plain; version=0.0.4')
+        elif self.path == '/metrics.json':
+            self._reply(json.dumps(snapshot()), 'application/json')
+        elif self.path == '/profile/start':
+            start_profiling()
+            self._reply('profiling started\n', 'text/plain')
+        elif self.path == '/profile/stop':
+            path = stop_profiling(os.getenv('PROFILE_PATH', 'profile.pstats'))
+            self._reply(f"profile written to {path}\n" if path else 'nothing was profiled\n', 'text/plain')
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to serve /metrics, /metrics.json and /profile/start|stop on a background thread
+def start_metrics_server(port, host='127.0.0.1'):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+# Function to write a JSON snapshot to path every interval seconds
+def start_json_dump(path, interval=60):
+    def dump():
+        while True:
+            time.sleep(interval)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot(), f)
+            os.replace(tmp_path, path)
+
+    threading.Thread(target=dump, name='metrics-json-dump', daemon=True).start()
+
+
+# Function to start the exporters configured by METRICS_PORT and METRICS_JSON_PATH, once per process
+def start_from_env():
+    with _lock:
+        if 'exporters' in _started:
+            return
+        _started.add('exporters')
+    if os.getenv('METRICS_PORT'):
+        enable()
+        start_metrics_server(int(os.getenv('METRICS_PORT')))
+    if os.getenv('METRICS_JSON_PATH'):
+        enable()
+        start_json_dump(os.getenv('METRICS_JSON_PATH'), float(os.getenv('METRICS_JSON_INTERVAL', '60')))
@@ -0,0 +1,144 @@
+# Sentence-level scoring of long article bodies, aggregated into a document-level CEFR distribution
+import argparse
+import heapq
+import json
+import math
+import re
+
+from prediction_cache import cached_score_texts
+from scoring import cefr_levels
+
+aggregations = ['mean', 'max', 'percentile']
+
+# A sentence ends after . ! ? or … (and any closing quote or bracket, which French sets off with a space)
+# followed by whitespace, or at a blank line
+_sentence_break = re.compile(r'(?<=[.!?…])(?P<closing>(?:\s?["»”’)\]])*)\s+(?=["«“(\[]?\s?[A-ZÀ-ÖØ-Þ0-9])'
+                             r'|\n\s*\n')
+# Common French abbreviations that end in a full stop without ending the sentence
+_abbreviations = {'M.', 'MM.', 'Mme.', 'Dr.', 'St.', 'p.', 'cf.', 'av.', 'apr.', 'J.-C.'}
+
+
+# Function to split text into sentences lazily, without building a list of them
+def iter_sentences(text):
+    start = 0
+    for match in _sentence_break.finditer(text):
+        # Closing quotes and brackets stay with the sentence they close
+        end = match.end('closing') if match.group('closing') is not None else match.start()
+        candidate = text[start:end].strip()
+        if candidate and candidate.split()[-1] in _abbreviations:
+            continue
+        if candidate:
+            yield ' '.join(candidate.split())
+        start = match.end()
+    tail = text[start:].strip()
+    if tail:
+        yield ' '.join(tail.split())
+
+
+# Function to batch an iterable without materialising it
+def _batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Function to score sentences in batches, yielding (sentence, probabilities) in document order
+def iter_sentence_scores(sentences, scorer, cache=None, batch_size=32):
+    """Sentences already scored, in this text or any other, come from the prediction cache."""
+    for batch in _batched(sentences, batch_size):
+        _, probabilities = cached_score_texts(batch, scorer, cache)
+        yield from zip(batch, probabilities)
+
+
+# Function to compute the expected level index (0 for A1 ... 5 for C2) of a distribution
+def expected_level(probabilities):
+    return sum(i * p for i, p in enumerate(probabilities))
+
+
+def score_document(text, scorer, aggregate='mean', percentile=90, top_k=3, cache=None, batch_size=32):
+    """Score a long text sentence by sentence and aggregate the results.
+
+    aggregate is one of:
+    - 'mean': the average sentence distribution.
+    - 'max': sentence distributions weighted by exp(expected level), so the hardest sentences dominate.
+    - 'percentile': the share of sentences at each predicted level; the document level is the
+      level at or below which `percentile`% of the sentences fall.
+    Memory stays flat: only running sums, a level histogram and the top_k hardest sentences are kept.
+    """
+    if aggregate not in aggregations:
+        raise ValueError(f"Unknown aggregation '{aggregate}', expected one of {aggregations}.")
+    count = 0
+    sums = [0.0] * len(cefr_levels)
+    weighted_sums = [0.0] * len(cefr_levels)
+    total_weight = 0.0
+    histogram = [0] * len(cefr_levels)
+    hardest = []
+    for sentence, probabilities in iter_sentence_scores(iter_sentences(text), scorer, cache, batch_size):
+        difficulty = expected_level(probabilities)
+        weight = math.exp(difficulty)
+        for i, p in enumerate(probabilities):
+            sums[i] += p
+            weighted_sums[i] += weight * p
+        total_weight += weight
+        histogram[max(range(len(probabilities)), key=probabilities.__getitem__)] += 1
+        # count breaks ties so sentences themselves are never compared; repeats are listed once
+        entry = (difficulty, -count, sentence)
+        if any(kept == sentence for _, _, kept in hardest):
+            pass
+        elif len(hardest) < top_k:
+            heapq.heappush(hardest, entry)
+        elif top_k:
+            heapq.heappushpop(hardest, entry)
+        count += 1
+
+    if not count:
+        return {'level': None, 'distribution': {}, 'sentences': 0, 'hardest_sentences': []}
+    if aggregate == 'mean':
+        distribution = [s / count for s in sums]
+    elif aggregate == 'max':
+        distribution = [s / total_weight for s in weighted_sums]
+    else:
+        distribution = [n / count for n in histogram]
+    if aggregate == 'percentile':
+        cumulative = 0
+        for index, n in enumerate(histogram):
+            cumulative += n
+            if cumulative >= count * percentile / 100:
+                break
+        level = cefr_levels[index]
+    else:
+        level = cefr_levels[max(range(len(distribution)), key=distribution.__getitem__)]
+    return {
+        'level': level,
+        'distribution': dict(zip(cefr_levels, distribution)),
+        'sentences': count,
+        'hardest_sentences': [{'sentence': sentence, 'expected_level': difficulty,
+                               'level': cefr_levels[min(len(cefr_levels) - 1, round(difficulty))]}
+                              for difficulty, _, sentence in sorted(hardest, reverse=True)],
+    }
+
+
+def main():
+    from model_registry import get_scorer
+
+    parser = argparse.ArgumentParser(description='Score the difficulty of a long French text, sentence by sentence.')
+    parser.add_argument('path', help='UTF-8 text file')
+    parser.add_argument('--aggregate', choices=aggregations, default='mean')
+    parser.add_argument('--percentile', type=float, default=90)
+    parser.add_argument('--top-k', type=int, default=3, help='Number of hardest sentences to report')
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    with open(args.path, encoding='utf-8') as f:
+        text = f.read()
+    result = score_document(text, get_scorer(), args.aggregate, args.percentile, args.top_k, batch_size=args.batch_size)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
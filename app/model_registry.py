@@ -0,0 +1,284 @@
+# Process-wide registry for the CamemBERT model and tokenizer
+import json
+import logging
+import os
+import resource
+import shutil
+import struct
+import threading
+import time
+
+import requests
+
+from scoring import cefr_levels
+
+logger = logging.getLogger(__name__)
+
+# torch and transformers are imported inside the loaders so pages that never score
+# (the landing page, the initial assessment) do not pay for them at startup
+
+# Directory the model files are downloaded to and loaded from
+model_dir = os.getenv('MODEL_DIR', 'text_difficulty_prediction/app')
+
+# Files needed to load the model, with their download locations on GitHub
+model_files = {
+    'config.json': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/config.json',
+    'tokenizer_config.json': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/tokenizer_config.json',
+    'special_tokens_map.json': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/special_tokens_map.json',
+    'added_tokens.json': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/added_tokens.json',
+    'model.safetensors': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/model.safetensors',
+    'sentencepiece.bpe': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/sentencepiece.bpe.model'
+}
+
+# safetensors dtype names and their torch equivalents
+safetensors_dtypes = {
+    'F64': 'float64', 'F32': 'float32', 'F16': 'float16', 'BF16': 'bfloat16',
+    'I64': 'int64', 'I32': 'int32', 'I16': 'int16', 'I8': 'int8', 'U8': 'uint8', 'BOOL': 'bool'
+}
+
+# The SentencePiece vocabulary is committed as a plain file next to this module
+vocabulary_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sentencepiece.bpe')
+
+# Shape of the randomly initialised CamemBERT used when the real weights are unavailable (benchmarks, CI)
+tiny_config = {'hidden_size': 32, 'num_hidden_layers': 2, 'num_attention_heads': 2, 'intermediate_size': 64}
+
+_lock = threading.Lock()
+_model_lock = threading.Lock()
+_models = {}
+_tokenizers = {}
+_metrics = {}
+# Fingerprint of the model files each loaded model was read from, by directory
+_loaded_fingerprints = {}
+
+
+# Function to download a single file from GitHub
+def download_file_from_github(url, destination):
+    response = requests.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to download {url} (status {response.status_code}).")
+    with open(destination, 'wb') as f:
+        f.write(response.content)
+
+
+# Function to make sure every model file is present on disk
+def ensure_model_files(directory=model_dir):
+    os.makedirs(directory, exist_ok=True)
+    for file_name, url in model_files.items():
+        file_path = os.path.join(directory, file_name)
+        if not os.path.exists(file_path):
+            download_file_from_github(url, file_path)
+
+
+# Function to check whether directory holds real weights rather than a missing file or a Git LFS pointer
+def has_model_weights(directory=model_dir):
+    path = os.path.join(directory, 'model.safetensors')
+    if not os.path.exists(path):
+        return False
+    with open(path, 'rb') as f:
+        return not f.read(64).startswith(b'version https://git-lfs')
+
+
+# Function to write a model and its tokenizer in the layout ensure_model_files and get_model expect
+def save_model_directory(model, tokenizer, directory):
+    os.makedirs(directory, exist_ok=True)
+    model.save_pretrained(directory)
+    tokenizer.save_pretrained(directory)
+    for file_name in ['sentencepiece.bpe', 'sentencepiece.bpe.model']:
+        shutil.copyfile(vocabulary_path, os.path.join(directory, file_name))
+    # Keep ensure_model_files from trying to download the files the tokenizer did not write
+    for file_name in model_files:
+        path = os.path.join(directory, file_name)
+        if not os.path.exists(path):
+            with open(path, 'w') as f:
+                f.write('{}\n')
+    return directory
+
+
+# Function to write a tiny randomly initialised CamemBERT with the real tokenizer to directory
+def create_tiny_model(directory, seed=0):
+    """Build (once) a model directory that loads like the real one, so scoring runs offline.
+
+    The weights are random but seeded, so predictions are reproducible from run to run.
+    """
+    if has_model_weights(directory):
+        return directory
+    import torch
+    from transformers import CamembertConfig, CamembertForSequenceClassification
+
+    tokenizer = load_vocabulary_tokenizer()
+    config = CamembertConfig(vocab_size=len(tokenizer), pad_token_id=tokenizer.pad_token_id,
+                             id2label=dict(enumerate(cefr_levels)), label2id={l: i for i, l in enumerate(cefr_levels)},
+                             **tiny_config)
+    torch.manual_seed(seed)
+    return save_model_directory(CamembertForSequenceClassification(config), tokenizer, directory)
+
+
+# Function to build the CamemBERT tokenizer from the committed SentencePiece vocabulary alone
+def load_vocabulary_tokenizer():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copyfile(vocabulary_path, os.path.join(directory, 'sentencepiece.bpe.model'))
+        return tokenizer_class().from_pretrained(directory)
+
+
+# Function to read the resident set size of this process in bytes
+def current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # ru_maxrss is the peak, in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+# Function to map a safetensors file into memory and view every tensor in place
+def load_mmap_state_dict(path):
+    """Return {name: tensor} backed by a private mmap of path, so processes share the page cache."""
+    import torch
+
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    state_dict = {}
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        header.pop('__metadata__', None)
+        for name, info in header.items():
+            tensor = torch.empty(0, dtype=getattr(torch, safetensors_dtypes[info['dtype']]))
+            begin, end = info['data_offsets']
+            offset = 8 + header_size + begin
+            if offset % tensor.element_size() == 0:
+                tensor.set_(storage, offset // tensor.element_size(), info['shape'])
+            else:
+                # Misaligned tensors cannot be viewed in place and are read into their own memory
+                f.seek(offset)
+                tensor = torch.frombuffer(bytearray(f.read(end - begin)), dtype=tensor.dtype).reshape(info['shape'])
+            state_dict[name] = tensor
+    return state_dict
+
+
+# Function to build the model around memory-mapped weights, falling back to from_pretrained
+def load_mmap_model(directory):
+    from transformers import CamembertConfig, CamembertForSequenceClassification
+    try:
+        from transformers.initialization import no_init_weights
+    except ImportError:
+        from transformers.modeling_utils import no_init_weights
+
+    config = CamembertConfig.from_pretrained(directory)
+    # Skip random initialisation: every parameter is replaced by a mapped tensor below
+    with no_init_weights():
+        model = CamembertForSequenceClassification(config)
+    state_dict = load_mmap_state_dict(os.path.join(directory, 'model.safetensors'))
+    result = model.load_state_dict(state_dict, assign=True, strict=False)
+    parameter_names = {name for name, _ in model.named_parameters()}
+    if any(name in parameter_names for name in result.missing_keys):
+        return CamembertForSequenceClassification.from_pretrained(directory)
+    return model
+
+
+def _load(directory):
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    tokenizer = get_tokenizer(directory)
+    from prediction_cache import model_fingerprint
+
+    # Taken before the weights are read: the model in memory stays the same even if the files are replaced
+    _loaded_fingerprints[directory] = model_fingerprint(directory)
+    model = load_mmap_model(directory)
+    model.eval()
+    _metrics.update({
+        'model_dir': directory,
+        'load_seconds': time.perf_counter() - start,
+        'rss_delta_bytes': current_rss_bytes() - rss_before,
+        'parameter_bytes': sum(p.numel() * p.element_size() for p in model.parameters()),
+        'loaded_at': time.time(),
+    })
+    return model, tokenizer
+
+
+# Function to pick the Rust-backed CamemBERT tokenizer class
+def tokenizer_class():
+    try:
+        from transformers import CamembertTokenizerFast
+        return CamembertTokenizerFast
+    except ImportError:
+        # transformers 5 only ships the Rust-backed tokenizer, under the plain name
+        from transformers import CamembertTokenizer
+        return CamembertTokenizer
+
+
+# Function to get the shared fast tokenizer alone, for backends that bring their own model
+def get_tokenizer(directory=model_dir):
+    tokenizer = _tokenizers.get(directory)
+    if tokenizer is not None:
+        return tokenizer
+    with _lock:
+        if directory not in _tokenizers:
+            ensure_model_files(directory)
+            tokenizer = tokenizer_class().from_pretrained(directory)
+            # Save the converted tokenizer so later loads skip the SentencePiece conversion
+            # Written to a private file and renamed, so a worker loading concurrently never reads half of it
+            tokenizer_path = os.path.join(directory, 'tokenizer.json')
+            if not os.path.exists(tokenizer_path):
+                tmp_path = f'{tokenizer_path}.{os.getpid()}.tmp'
+                try:
+                    tokenizer.backend_tokenizer.save(tmp_path)
+                    os.replace(tmp_path, tokenizer_path)
+                except OSError as e:
+                    logger.info("Not caching the converted tokenizer in %s: %s", directory, e)
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            _tokenizers[directory] = tokenizer
+        return _tokenizers[directory]
+
+
+# Function to get the shared model and tokenizer, loading them on first use
+def get_model(directory=model_dir):
+    """Return (model, tokenizer), loaded once per process and shared by all sessions."""
+    loaded = _models.get(directory)
+    if loaded is not None:
+        return loaded
+    with _model_lock:
+        if directory not in _models:
+            _models[directory] = _load(directory)
+        return _models[directory]
+
+
+# Function to get the fingerprint of the model files get_model loaded from directory, or None before loading
+def loaded_fingerprint(directory=model_dir):
+    return _loaded_fingerprints.get(directory)
+
+
+# Function to check whether the model has been loaded yet
+def is_loaded():
+    return bool(_models)
+
+
+# Function to report load-time and memory metrics for the loaded model
+def model_metrics():
+    metrics = dict(_metrics)
+    metrics['loaded'] = is_loaded()
+    metrics['rss_bytes'] = current_rss_bytes()
+    return metrics
+
+
+# Function to get the scorer used by the app: the inference service if configured, else the configured backend
+def get_scorer():
+    server_url = os.getenv('INFERENCE_SERVER_URL')
+    if server_url:
+        from inference_client import InferenceClient
+        scorer = InferenceClient(server_url)
+    else:
+        from backends import get_backend
+        scorer = get_backend()
+    # With CASCADE_THRESHOLD set, the feature classifier answers confident texts before the transformer,
+    # as long as it has been trained; it is never trained here
+    threshold = os.getenv('CASCADE_THRESHOLD')
+    if threshold:
+        from fallback_classifier import CascadeScorer, get_fallback_classifier
+        classifier = get_fallback_classifier()
+        if classifier is not None:
+            scorer = CascadeScorer(classifier, scorer, float(threshold))
+    return scorer
@@ -0,0 +1,178 @@
+# Content-addressed cache of difficulty predictions: in-memory LRU in front of SQLite
+import array
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from instrumentation import inc
+from model_registry import model_dir
+from scoring import probabilities_to_levels
+
+# Files whose contents identify a trained model
+fingerprint_files = ['config.json', 'model.safetensors']
+
+_fingerprints = {}
+_cache_lock = threading.Lock()
+_caches = {}
+
+
+# Function to normalize article text before hashing
+def normalize_text(text):
+    return ' '.join(unicodedata.normalize('NFC', text or '').split())
+
+
+# Function to compute a digest of the model files, recomputed only when they change on disk
+def model_fingerprint(directory=model_dir):
+    return files_fingerprint([os.path.join(directory, name) for name in fingerprint_files])
+
+
+# Function to compute a digest of the contents of files, recomputed only when one changes on disk
+def files_fingerprint(paths):
+    signature = tuple((path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in paths)
+    if signature not in _fingerprints:
+        digest = hashlib.sha256()
+        for path in paths:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        _fingerprints[signature] = digest.hexdigest()
+    return _fingerprints[signature]
+
+
+# Function to get the fingerprint a scorer's predictions are cached under, or None if it cannot tell
+def scorer_fingerprint(scorer):
+    """Scorers record it when they load their model, so replacing the files on disk does not change it."""
+    return getattr(scorer, 'fingerprint', None)
+
+
+class PredictionCache:
+    """Two-tier cache of class probabilities keyed by text hash and model fingerprint."""
+
+    def __init__(self, path, fingerprint, memory_size=2048, max_entries=100000):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS predictions '
+                        '(key TEXT PRIMARY KEY, fingerprint TEXT, probabilities BLOB, last_used REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)')
+        # Entries of other models are left alone, since another process may still use them; once nothing
+        # reads them they are the least recently used and the first to be evicted
+
+    # Function to compute the cache key of a text for this model
+    def key(self, text):
+        return hashlib.sha256(f"{self.fingerprint}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def _remember(self, key, probabilities):
+        self.memory[key] = probabilities
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    # Function to look texts up, returning {position: probabilities} for the hits
+    def get_many(self, texts):
+        keys = [self.key(text) for text in texts]
+        found = {}
+        with self.lock:
+            missing = {}
+            for i, key in enumerate(keys):
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[i] = self.memory[key]
+                    self.counters['memory_hits'] += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+            if missing:
+                placeholders = ','.join('?' * len(missing))
+                rows = self.db.execute(f'SELECT key, probabilities FROM predictions WHERE key IN ({placeholders})',
+                                       list(missing)).fetchall()
+                for key, blob in rows:
+                    probabilities = array.array('f', blob).tolist()
+                    self._remember(key, probabilities)
+                    for i in missing.pop(key):
+                        found[i] = probabilities
+                        self.counters['disk_hits'] += 1
+                if rows:
+                    self.db.executemany('UPDATE predictions SET last_used = ? WHERE key = ?',
+                                        [(time.time(), key) for key, _ in rows])
+                self.counters['misses'] += sum(len(positions) for positions in missing.values())
+        inc('prediction_cache_lookups_total', len(keys))
+        inc('prediction_cache_hits_total', len(found))
+        return found
+
+    # Function to store probabilities for texts and evict the least recently used entries
+    def put_many(self, texts, probabilities):
+        now = time.time()
+        rows = []
+        with self.lock:
+            for text, row in zip(texts, probabilities):
+                key = self.key(text)
+                self._remember(key, row)
+                rows.append((key, self.fingerprint, array.array('f', row).tobytes(), now))
+            self.db.execute('BEGIN')
+            self.db.executemany('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)', rows)
+            count = self.db.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+            if count > self.max_entries:
+                # Evict down to 90% of the bound so eviction does not run on every insert
+                excess = count - int(self.max_entries * 0.9)
+                self.db.execute('DELETE FROM predictions WHERE key IN '
+                                '(SELECT key FROM predictions ORDER BY last_used LIMIT ?)', (excess,))
+                self.counters['evictions'] += excess
+            self.db.execute('COMMIT')
+
+    # Function to report hit/miss counters
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['entries'] = self.db.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# Function to get the shared cache of a scorer's predictions, one per model fingerprint in a single file
+def get_prediction_cache(scorer):
+    """Return the cache for the model scorer runs, or None if its predictions cannot be cached."""
+    fingerprint = scorer_fingerprint(scorer)
+    if fingerprint is None:
+        return None
+    with _cache_lock:
+        if fingerprint not in _caches:
+            path = os.getenv('PREDICTION_CACHE_PATH', os.path.join(model_dir, 'predictions.sqlite3'))
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            _caches[fingerprint] = PredictionCache(path, fingerprint)
+        return _caches[fingerprint]
+
+
+# Function to score texts with a scorer, running it only on cache misses
+def cached_score_texts(texts, scorer, cache=None):
+    """Without a cache, the scorer's own is used; a scorer that has none scores every text."""
+    texts = list(texts)
+    cache = cache or get_prediction_cache(scorer)
+    if cache is None:
+        return scorer.score_texts(texts)
+    found = cache.get_many(texts)
+    misses = [i for i in range(len(texts)) if i not in found]
+    if misses:
+        # Texts repeated within the batch are scored once
+        unique = list(dict.fromkeys(normalize_text(texts[i]) for i in misses))
+        _, probabilities = scorer.score_texts(unique)
+        cache.put_many(unique, probabilities)
+        scored = dict(zip(unique, probabilities))
+        for i in misses:
+            found[i] = scored[normalize_text(texts[i])]
+    probabilities = [found[i] for i in range(len(texts))]
+    return probabilities_to_levels(probabilities), probabilities
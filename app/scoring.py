@@ -0,0 +1,84 @@
+# Batched difficulty scoring for CamemBERT
+from instrumentation import observe, timer
+from tokenization import get_token_cache
+
+# CEFR levels in the order of the model's output indices
+cefr_levels = ['A1', 'A2', 'B1', 'B2', 'C1', 'C2']
+
+
+# Function to tokenize texts without padding so each one keeps its own length
+def encode_texts(texts, tokenizer, max_length=512, cache=True):
+    """Texts seen before come from the token cache; pass cache=False for one-pass streams."""
+    with timer('tokenization'):
+        if cache:
+            input_ids = get_token_cache(tokenizer).encode(texts, max_length)
+        else:
+            input_ids = tokenizer(list(texts), truncation=True, max_length=max_length, padding=False)['input_ids']
+    for ids in input_ids:
+        observe('token_length', len(ids))
+    return input_ids
+
+
+# Function to group encoded texts into micro-batches of similar length
+def bucket_batches(encoded, batch_size=16):
+    """Yield lists of input positions, each bucket holding sequences of similar length."""
+    order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+
+# Function to pad one bucket only up to its own longest sequence
+def pad_batch(sequences, pad_token_id):
+    import torch
+    longest = max(len(ids) for ids in sequences)
+    input_ids = torch.full((len(sequences), longest), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), longest), dtype=torch.long)
+    for row, ids in enumerate(sequences):
+        input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, :len(ids)] = 1
+    return input_ids, attention_mask
+
+
+# Function to score encoded sequences, returning probabilities in input order
+def score_encoded(encoded, model, pad_token_id, batch_size=16):
+    import torch
+    probabilities = [None] * len(encoded)
+    with torch.inference_mode():
+        for bucket in bucket_batches(encoded, batch_size):
+            observe('batch_size', len(bucket))
+            input_ids, attention_mask = pad_batch([encoded[i] for i in bucket], pad_token_id)
+            with timer('forward'):
+                logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+            for i, row in zip(bucket, torch.softmax(logits, dim=-1).tolist()):
+                probabilities[i] = row
+    return probabilities
+
+
+# Function to map class probabilities to CEFR levels
+def probabilities_to_levels(probabilities):
+    return [cefr_levels[max(range(len(row)), key=row.__getitem__)] for row in probabilities]
+
+
+# Function to score a whole list of texts in length-bucketed micro-batches
+def score_texts(texts, model, tokenizer, batch_size=16, max_length=512):
+    """Return (levels, probabilities) for texts, in the same order as the input."""
+    texts = list(texts)
+    if not texts:
+        return [], []
+    encoded = encode_texts(texts, tokenizer, max_length)
+    probabilities = score_encoded(encoded, model, tokenizer.pad_token_id, batch_size)
+    return probabilities_to_levels(probabilities), probabilities
+
+
+# Scores texts with a model and tokenizer loaded in this process
+class LocalScorer:
+    def __init__(self, model, tokenizer, batch_size=16, max_length=512, fingerprint=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.max_length = max_length
+        # Identifies the model in prediction caches; None leaves its predictions uncached
+        self.fingerprint = fingerprint
+
+    def score_texts(self, texts):
+        return score_texts(texts, self.model, self.tokenizer, self.batch_size, self.max_length)
@@ -1,56 +1,64 @@
 # Import necessary libraries
-import torch
+import logging
 import streamlit as st
-import requests
-import os
-from transformers import CamembertTokenizer, CamembertForSequenceClassification
 import streamlit.components.v1 as components
 from itertools import cycle
 from dotenv import load_dotenv
+from prediction_cache import get_prediction_cache
+from model_registry import get_scorer, model_metrics
+from ingestion import get_feed, news_categories, stream_feed
+from user_store import get_user_store, level_position
+from identity import cookie_max_age, cookie_name, new_user_id, sign_user_id, verify_token
+from embedding_index import AdaptiveAssessment, assessment_answers, get_embedding_index
+from instrumentation import inc, start_from_env, timer
+
+logger = logging.getLogger(__name__)
 
 # load environment variables
 load_dotenv()
 
-st.set_page_config(layout='wide', page_title="OuiOui French Learning")
-
-# Initialize user data and levels
-cefr_levels = ['A1', 'A2', 'B1', 'B2', 'C1', 'C2']
-default_user_data = {'default_user': {'level': 'A1', 'feedback_points': 0}}
-
-# Function to ensure that user data is initialized in session state
-def ensure_user_data():
-    if 'users' not in st.session_state:
-        st.session_state['users'] = default_user_data.copy()
+# Start the metrics exporters configured in the environment, once per process
+start_from_env()
 
+st.set_page_config(layout='wide', page_title="OuiOui French Learning")
 
-# Fetch news articles from MediaStack
-mediastack_api_key = os.getenv('MEDIASTACK_API_KEY')
-base_url = "http://api.mediastack.com/v1/news"
-
-# Fetch news articles from mediastack API
-def fetch_news(category):
-    params = {
-        'access_key': mediastack_api_key,
-        'languages': "fr",
-        'categories': category,
-        'limit': 1
-    }
-    response = requests.get(base_url, params=params)
-    if response.status_code == 200:
-        return response.json()['data']
-    else:
-        st.error('Failed to retrieve news articles.')
-        return []
+# Function to get the account of a learner signed in with Streamlit authentication, if any
+def signed_in_user_id():
+    user = getattr(st, 'user', None)
+    if user is not None and user.get('is_logged_in'):
+        account = user.get('email') or user.get('sub')
+        if account:
+            return f"account:{account}"
+    return None
+
+# Function to get the learner id from the signed cookie, minting a new one (and its cookie) if there is none
+def cookie_user_id():
+    context = getattr(st, 'context', None)
+    cookies = getattr(context, 'cookies', None) or {}
+    user_id = verify_token(cookies.get(cookie_name))
+    if user_id is None:
+        user_id = new_user_id()
+        st.session_state['user_cookie'] = sign_user_id(user_id)
+    return user_id
+
+# Function to get the id of the current learner, which outlives the browser session
+def current_user_id():
+    # Only a signed-in account or a cookie we signed is trusted as identity, never a plain request value
+    if 'user_id' not in st.session_state:
+        st.session_state['user_id'] = signed_in_user_id() or cookie_user_id()
+    return st.session_state['user_id']
+
+# Function to store a newly minted learner id in the browser, re-sent on every run until the page keeps it
+def remember_user_cookie():
+    token = st.session_state.get('user_cookie')
+    if token:
+        components.html(f"<script>window.parent.document.cookie = '{cookie_name}={token}; "
+                        f"max-age={cookie_max_age}; path=/; SameSite=Lax';</script>", height=0)
+
+# Function to read the learner's profile; nothing is stored until they give feedback or finish the assessment
+def load_user_data(user_id=None):
+    return get_user_store().get_user(user_id or current_user_id())
 
-# Function to check if the image URL is valid
-def is_valid_image_url(url):
-    if url is None:
-        return False
-    try:
-        response = requests.head(url, timeout=5)
-        return response.status_code == 200 and 'image' in response.headers['Content-Type']
-    except requests.RequestException:
-        return False
 
 # Function to assign levels to articles
 # def assign_article_levels(articles):
@@ -60,96 +68,39 @@ def is_valid_image_url(url):
 #         article['level'] = next(level_cycle)  # Assign levels in a cyclic manner
 #     return valid_articles
 
-# Load the model from GitHub
-def download_file_from_github(url, destination):
-    response = requests.get(url)
-    if response.status_code == 200:
-        with open(destination, 'wb') as f:
-            f.write(response.content)
-    else:
-        st.error("Failed to download file. Check the URL and network connection.")
-
-def setup_model():
-    """Setup the model by ensuring all necessary files are downloaded and loaded."""
-    model_dir = 'text_difficulty_prediction/app'
-    os.makedirs(model_dir, exist_ok=True)
-
-    # Check if model files are already downloaded, else download them
-    model_files = {
-        'config.json': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/config.json',
-        'tokenizer_config.json': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/tokenizer_config.json',
-        'special_tokens_map.json': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/special_tokens_map.json',
-        'added_tokens.json': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/added_tokens.json',
-        'model.safetensors': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/model.safetensors',
-        'sentencepiece.bpe': 'https://github.com/vgentile98/text_difficulty_prediction/raw/main/app/sentencepiece.bpe.model'
-    }
-
-    for file_name, url in model_files.items():
-        file_path = os.path.join(model_dir, file_name)
-        if not os.path.exists(file_path):
-            download_file_from_github(url, file_path)
-
-    # Load model and tokenizer
-    try:
-        tokenizer = CamembertTokenizer.from_pretrained(model_dir)
-        model = CamembertForSequenceClassification.from_pretrained(model_dir)
-        return model, tokenizer
-    except Exception as e:
-        st.exception(e)
-        raise
-
-# Setup the model
-try:
-    model, tokenizer = setup_model()
-except Exception as e:
-    st.error("An error occurred while setting up the model.")
-
 # Function to update user level based on feedback
 def update_user_level(user_id, feedback):
-    # Make sure user data is available
-    ensure_user_data()
-
-    # Access the user data safely from session state
-    feedback_points = {'Too Easy': 1, 'Just Right': 0.5, 'Challenging': 0.5, 'Too Difficult': -1}
-    user_data = st.session_state['users'][user_id]
-    user_data['feedback_points'] += feedback_points[feedback]
+    # The store applies the points and thresholds in one atomic read-modify-write
+    return get_user_store().record_feedback(user_id, feedback)['level']
 
-    # Thresholds for level change
-    upgrade_threshold = 3 # Points needed to move up a level
-    downgrade_threshold = -3 # Points needed to move down a level
-
-    # Accessing CEFR levels
-    current_index = cefr_levels.index(user_data['level'])
-
-    # Level Change
-    if user_data['feedback_points'] >= upgrade_threshold:
-        new_index = min(current_index + 1, len(cefr_levels) - 1)
-        user_data['level'] = cefr_levels[new_index]
-        user_data['feedback_points'] = 0 # Reset points after level change
-    elif user_data['feedback_points'] <= downgrade_threshold:
-        new_index = max(current_index - 1, 0)
-        user_data['level'] = cefr_levels[new_index]
-        user_data['feedback_points'] = 0 # Reset points after level change
-
-    # Update the user data in session state
-    st.session_state['users'][user_id] = user_data
-
-    return user_data['level']
-
-def predict_article_levels(articles, model, tokenizer):
-    for article in articles:
-        if is_valid_image_url(article.get('image')):
-            text = article['title'] + " " + article['description']
-            inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
-            with torch.no_grad():
-                outputs = model(**inputs)
-                predictions = outputs.logits.argmax(-1).item()
-            # Assuming you've mapped the model's output indices to CEFR levels:
-                article['level'] = cefr_levels[predictions]
-    return articles
+# Function for the adaptive assessment: reference sentences chosen at the learner's estimated level
+def adaptive_assessment(index):
+    st.title('Initial French Level Assessment')
+    st.write("How well do you understand each sentence?")
+    assessment = st.session_state.setdefault('adaptive_assessment', AdaptiveAssessment())
+    if not assessment.done():
+        item = assessment.next_item(index)
+        st.write(f"**Sentence {len(assessment.answers) + 1} of {assessment.length}:** {index.texts[item]}")
+        cols = st.columns(len(assessment_answers))
+        for col, answer in zip(cols, assessment_answers):
+            if col.button(answer, key=f"assessment_{len(assessment.answers)}_{answer}"):
+                assessment.record(answer)
+                st.experimental_rerun()
+        return
+    level = assessment.level()
+    get_user_store().set_level(current_user_id(), level)
+    st.session_state['initial_assessment'] = False
+    del st.session_state['adaptive_assessment']
+    st.write(f"Your level is: {level}")
+    st.experimental_rerun()
 
 # Function for initial assessment
 def initial_assessment():
+    # With the reference index built, the fixed questions below give way to the adaptive assessment
+    index = get_embedding_index()
+    if index is not None:
+        return adaptive_assessment(index)
+
     st.title('Initial French Level Assessment')
     st.write("Select the main idea of the following sentences:")
 
@@ -171,7 +122,7 @@ def initial_assessment():
             total_score += 1
 
     if st.button("Submit"):
-        user_id = 'default_user'
+        user_id = current_user_id()
         if total_score <= 2:
             level = 'A1'
         elif total_score <= 4:
@@ -184,13 +135,52 @@ def initial_assessment():
             level = 'C1'
         else:
             level = 'C2'
-        st.session_state['users'][user_id]['level'] = level
+        get_user_store().set_level(user_id, level)
         st.session_state['initial_assessment'] = False
         st.write(f"Your level is: {level}")
         st.experimental_rerun()
 
+# Function to render one article with its feedback buttons
+def render_article(idx, article, user_id):
+    with st.container():
+        # First row for image and level
+        col1, col2 = st.columns([0.9, 0.1])
+        with col1:
+            st.image(article['image'], width=300)
+        with col2:
+            st.markdown(f"<div style='border: 1px solid gray; border-radius: 4px; padding: 10px; text-align: center;'><strong>{article['level']}</strong></div>", unsafe_allow_html=True)
+        st.subheader(article['title'])
+        st.write(article['description'])
+        with st.expander("Read Now"):
+            components.iframe(article['url'], height=450, scrolling=True)
+            cols = st.columns(4)
+            feedback_options = ['Too Easy', 'Just Right', 'Challenging', 'Too Difficult']
+            for i, option in enumerate(feedback_options):
+                if cols[i].button(option, key=f"feedback_{idx}_{i}"):
+                    update_user_level(user_id, option)
+                    st.experimental_rerun()
+        st.markdown("---")
+
+# Function to stream a category's articles, ending early (and noting it in failed) if the feed raises
+def stream_articles(category, level, failed):
+    # Loading the model or reaching the inference service happens on this request path and can fail;
+    # only the feed is guarded, so Streamlit's own control flow from the page still propagates
+    articles = stream_feed(category, level)
+    while True:
+        try:
+            article = next(articles)
+        except StopIteration:
+            return
+        except Exception as e:
+            logger.exception("Streaming the '%s' feed failed", category)
+            inc('pipeline_errors_total', stage='stream')
+            failed.append(e)
+            return
+        yield article
+
 def main():
-    ensure_user_data()
+    current_user_id()
+    remember_user_cookie()
 
     if 'start' not in st.session_state:
         st.session_state['start'] = False  # This keeps track of whether the user has started the app
@@ -221,47 +211,58 @@ def main():
         st.subheader('Read, learn, and grow at your own pace!')
 
         # Select options for the API request
-        category = st.selectbox("What do you want to read about?", ['general', 'business', 'technology', 'entertainment', 'sports', 'science', 'health'], index=1)
+        category = st.selectbox("What do you want to read about?", news_categories, index=1)
         st.markdown("---")
 
         # Sidebar elements
         with st.sidebar:
             logo_url = "https://raw.githubusercontent.com/vgentile98/text_difficulty_prediction/main/app/baguette_logo.png"
             st.image(logo_url, width=200)
-            user_id = 'default_user'
-            ensure_user_data()
-            user_level = st.session_state['users'][user_id]['level']
+            user_id = current_user_id()
+            user = load_user_data(user_id)
+            user_level = user['level']
             st.subheader(f"Your current level: {user_level}")
-
-        ensure_user_data()
-
-        user_id = 'default_user'
-        user_level = st.session_state['users'][user_id]['level']
-
-        articles = fetch_news(category)
+            metrics = model_metrics()
+            if metrics['loaded']:
+                st.caption(f"Model loaded in {metrics['load_seconds']:.1f}s, "
+                           f"process memory {metrics['rss_bytes'] / 2**20:.0f} MB")
+                cache = get_prediction_cache(get_scorer())
+                if cache is not None:
+                    cache_stats = cache.stats()
+                    st.caption(f"Prediction cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits, "
+                               f"{cache_stats['misses']} misses")
+
+        # Articles are fetched and scored in the background, so the page only reads the index
+        feed = get_feed()
+        index = get_embedding_index()
+        if index is not None:
+            # Articles of any level close to the learner, from the probabilities stored at scoring time
+            articles = feed.near(category, level_position(user), calibrate=index.calibrate)
+        else:
+            articles = feed.get(category, user_level)
+        inc('articles_dropped_total', feed.category_size(category) - len(articles), reason='level_filter')
         if articles:
-            articles = predict_article_levels(articles, model, tokenizer)
-            articles = [article for article in articles if article.get('level') == user_level and is_valid_image_url(article.get('image'))]
-            for idx, article in enumerate(articles):
-                with st.container():
-                    # First row for image and level
-                    col1, col2 = st.columns([0.9, 0.1])
-                    with col1:
-                        st.image(article['image'], width=300)
-                    with col2:
-                        st.markdown(f"<div style='border: 1px solid gray; border-radius: 4px; padding: 10px; text-align: center;'><strong>{article['level']}</strong></div>", unsafe_allow_html=True)
-                    st.subheader(article['title'])
-                    st.write(article['description'])
-                    with st.expander("Read Now"):
-                        components.iframe(article['url'], height=450, scrolling=True)
-                        cols = st.columns(4)
-                        feedback_options = ['Too Easy', 'Just Right', 'Challenging', 'Too Difficult']
-                        for i, option in enumerate(feedback_options):
-                            if cols[i].button(option, key=f"feedback_{idx}_{i}"):
-                                new_level = update_user_level(user_id, option)
-                                st.session_state['users'][user_id]['level'] = new_level
-                                st.experimental_rerun()
-                    st.markdown("---")
+            with timer('render'):
+                for idx, article in enumerate(articles):
+                    render_article(idx, article, user_id)
+        elif not feed.is_ready(category):
+            # Until the background pass reaches this category, show its articles as each one is scored
+            placeholder = st.empty()
+            placeholder.info("We are preparing fresh articles for you...")
+            shown = 0
+            failed = []
+            with timer('render'):
+                for idx, article in enumerate(stream_articles(category, user_level, failed)):
+                    if not shown:
+                        placeholder.empty()
+                    render_article(idx, article, user_id)
+                    shown += 1
+            if failed:
+                placeholder.error('Failed to retrieve news articles.')
+            elif not shown:
+                placeholder.info("We are preparing fresh articles for you. Check back in a moment!")
+        elif feed.last_error(category):
+            st.error('Failed to retrieve news articles.')
         else:
             st.write("No articles found. Try adjusting your filters.")
 
@@ -0,0 +1,219 @@
+# Cached tokenization and memory-mapped pre-tokenized corpora
+import argparse
+import csv
+import hashlib
+import json
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+from instrumentation import inc
+
+_caches_lock = threading.Lock()
+_caches = weakref.WeakKeyDictionary()
+
+
+class TokenCache:
+    """LRU of token ids keyed by a hash of the text, in front of one tokenizer.
+
+    Misses from a call are tokenized together in a single batch call, which the
+    Rust-backed tokenizer spreads over its own threads.
+    """
+
+    def __init__(self, tokenizer, max_entries=50000):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(text, max_length):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest(), max_length
+
+    # Function to encode texts without padding, returning one list of ids per text in input order
+    def encode(self, texts, max_length=512):
+        texts = list(texts)
+        keys = [self.key(text, max_length) for text in texts]
+        input_ids = [None] * len(texts)
+        missing = {}
+        with self.lock:
+            for i, key in enumerate(keys):
+                ids = self.entries.get(key)
+                if ids is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    self.entries.move_to_end(key)
+                    input_ids[i] = ids
+        inc('token_cache_lookups_total', len(texts))
+        inc('token_cache_hits_total', len(texts) - sum(len(positions) for positions in missing.values()))
+        if missing:
+            # Duplicates within the call are tokenized once
+            encoded = self.tokenizer([texts[positions[0]] for positions in missing.values()],
+                                     truncation=True, max_length=max_length, padding=False)['input_ids']
+            with self.lock:
+                for (key, positions), ids in zip(missing.items(), encoded):
+                    for i in positions:
+                        input_ids[i] = ids
+                    self.entries[key] = ids
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return input_ids
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Function to get the cache shared by every caller of this tokenizer in the process
+def get_token_cache(tokenizer):
+    cache = _caches.get(tokenizer)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(tokenizer)
+            if cache is None:
+                cache = _caches[tokenizer] = TokenCache(tokenizer, int(os.getenv('TOKEN_CACHE_SIZE', '50000')))
+    return cache
+
+
+class RowIds:
+    """The CSV row ids of a pretokenized corpus, UTF-8 encoded back to back in `<prefix>.row_ids.npy`.
+
+    Id i is decoded from the mapped bytes on access, so no list of every id is held in memory.
+    """
+
+    def __init__(self, prefix):
+        import numpy as np
+
+        self.data = np.load(prefix + '.row_ids.npy', mmap_mode='r')
+        self.offsets = np.load(prefix + '.row_id_offsets.npy', mmap_mode='r')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+
+class PretokenizedCorpus:
+    """A corpus written by pretokenize(), mapped read-only into memory.
+
+    Token ids of every text are stored back to back in `<prefix>.ids.npy`; text i is
+    ids[offsets[i]:offsets[i + 1]]. Indexing returns views, so nothing is copied.
+    """
+
+    def __init__(self, prefix):
+        import numpy as np
+
+        with open(prefix + '.json') as f:
+            self.meta = json.load(f)
+        self.ids = np.load(prefix + '.ids.npy', mmap_mode='r')
+        self.offsets = np.load(prefix + '.offsets.npy', mmap_mode='r')
+        self.labels = np.load(prefix + '.labels.npy', mmap_mode='r') if self.meta['has_labels'] else None
+        self.row_ids = RowIds(prefix)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def lengths(self):
+        return self.offsets[1:] - self.offsets[:-1]
+
+    # Function to get the encoded texts as lists of ints, the form score_encoded takes
+    def encoded(self, indices=None):
+        indices = range(len(self)) if indices is None else indices
+        return [self[i].tolist() for i in indices]
+
+
+# Function to hash a file's contents, so a corpus can tell an edited source from a merely touched one
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to tokenize a CSV corpus chunk by chunk into memory-mapped arrays of ids and offsets
+def pretokenize(csv_path, prefix, tokenizer, max_length=512, text_column='sentence', label_column='difficulty',
+                chunk_size=4096):
+    """Write <prefix>.ids.npy, <prefix>.offsets.npy, <prefix>.row_ids.npy, <prefix>.row_id_offsets.npy,
+    <prefix>.json and, if the CSV has labels, <prefix>.labels.npy.
+
+    Ids are stored as uint16 when the vocabulary fits, int32 otherwise.
+    """
+    import numpy as np
+    from scoring import cefr_levels
+
+    dtype = np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max + 1 else np.int32
+    source = os.stat(csv_path)
+    raw_path = prefix + '.ids.raw'
+    raw_row_ids_path = prefix + '.row_ids.raw'
+    offsets = [0]
+    row_id_offsets = [0]
+    labels = []
+
+    def flush(texts, raw):
+        for ids in tokenizer(texts, truncation=True, max_length=max_length, padding=False)['input_ids']:
+            np.asarray(ids, dtype=dtype).tofile(raw)
+            offsets.append(offsets[-1] + len(ids))
+
+    # Ids are streamed to a raw file first, so memory stays bounded by one chunk
+    with open(csv_path, newline='', encoding='utf-8') as f, open(raw_path, 'wb') as raw, \
+            open(raw_row_ids_path, 'wb') as raw_row_ids:
+        reader = csv.DictReader(f)
+        has_labels = label_column in (reader.fieldnames or [])
+        texts = []
+        for row in reader:
+            texts.append(row[text_column])
+            row_id = row.get('id', str(len(row_id_offsets) - 1)).encode('utf-8')
+            raw_row_ids.write(row_id)
+            row_id_offsets.append(row_id_offsets[-1] + len(row_id))
+            if has_labels:
+                labels.append(cefr_levels.index(row[label_column]))
+            if len(texts) == chunk_size:
+                flush(texts, raw)
+                texts = []
+        if texts:
+            flush(texts, raw)
+
+    if offsets[-1]:
+        ids = np.lib.format.open_memmap(prefix + '.ids.npy', mode='w+', dtype=dtype, shape=(offsets[-1],))
+        ids[:] = np.memmap(raw_path, dtype=dtype, mode='r', shape=(offsets[-1],))
+        ids.flush()
+        del ids
+    else:
+        np.save(prefix + '.ids.npy', np.zeros(0, dtype=dtype))
+    os.remove(raw_path)
+    np.save(prefix + '.offsets.npy', np.asarray(offsets, dtype=np.int64))
+    np.save(prefix + '.row_ids.npy', np.fromfile(raw_row_ids_path, dtype=np.uint8))
+    os.remove(raw_row_ids_path)
+    np.save(prefix + '.row_id_offsets.npy', np.asarray(row_id_offsets, dtype=np.int64))
+    if has_labels:
+        np.save(prefix + '.labels.npy', np.asarray(labels, dtype=np.int8))
+    with open(prefix + '.json', 'w') as f:
+        json.dump({'source': os.path.abspath(csv_path), 'source_size': source.st_size,
+                   'source_mtime_ns': source.st_mtime_ns, 'source_sha256': file_digest(csv_path),
+                   'texts': len(offsets) - 1, 'tokens': offsets[-1],
+                   'dtype': np.dtype(dtype).name, 'max_length': max_length, 'vocab_size': len(tokenizer),
+                   'pad_token_id': tokenizer.pad_token_id, 'has_labels': has_labels}, f)
+    return PretokenizedCorpus(prefix)
+
+
+def main():
+    from model_registry import get_tokenizer, model_dir
+
+    parser = argparse.ArgumentParser(description='Pre-tokenize a CSV corpus into memory-mapped token ids.')
+    parser.add_argument('input', help='CSV with a sentence column, e.g. data/training_data.csv')
+    parser.add_argument('prefix', help='Output path prefix, e.g. data/training_data')
+    parser.add_argument('--model-dir', default=model_dir)
+    parser.add_argument('--max-length', type=int, default=512)
+    args = parser.parse_args()
+
+    corpus = pretokenize(args.input, args.prefix, get_tokenizer(args.model_dir), args.max_length)
+    print(f"{len(corpus)} texts, {corpus.meta['tokens']} tokens ({corpus.meta['dtype']}) written to {args.prefix}.*")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+# Persistent learner profiles: level, feedback points and feedback history
+import abc
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from scoring import cefr_levels
+
+# Points awarded for each feedback option and the thresholds that move a learner between levels
+feedback_points = {'Too Easy': 1, 'Just Right': 0.5, 'Challenging': 0.5, 'Too Difficult': -1}
+upgrade_threshold = 3
+downgrade_threshold = -3
+default_level = 'A1'
+
+_store_lock = threading.Lock()
+_store = None
+
+
+# Function to apply one feedback click to a learner's level and points
+def apply_feedback(level, points, feedback):
+    points += feedback_points[feedback]
+    current_index = cefr_levels.index(level)
+    if points >= upgrade_threshold:
+        level = cefr_levels[min(current_index + 1, len(cefr_levels) - 1)]
+        points = 0  # Reset points after level change
+    elif points <= downgrade_threshold:
+        level = cefr_levels[max(current_index - 1, 0)]
+        points = 0  # Reset points after level change
+    return level, points
+
+
+# Function to place a learner on the continuous level scale (0 for A1 ... 5 for C2)
+def level_position(user):
+    """Feedback points move the learner within half a level of their current one."""
+    points = user['feedback_points']
+    fraction = points / upgrade_threshold if points >= 0 else -points / downgrade_threshold
+    return cefr_levels.index(user['level']) + 0.5 * fraction
+
+
+class UserStore(abc.ABC):
+    """Interface for learner profile storage shared by every session and replica."""
+
+    @abc.abstractmethod
+    def get_user(self, user_id):
+        """Return {'level', 'feedback_points'}, the defaults for a learner who has not been stored yet."""
+
+    @abc.abstractmethod
+    def set_level(self, user_id, level):
+        pass
+
+    @abc.abstractmethod
+    def record_feedback(self, user_id, feedback):
+        """Atomically apply a feedback click, log it and return the updated profile."""
+
+    @abc.abstractmethod
+    def feedback_history(self, user_id, limit=50):
+        pass
+
+
+class SQLiteUserStore(UserStore):
+    """UserStore on SQLite in WAL mode.
+
+    Reads use per-thread connections and never wait for writers. Writes are queued to one
+    writer thread that applies everything pending in a single transaction (group commit);
+    each read-modify-write runs inside that transaction, so concurrent clicks, including
+    ones from other processes sharing the file, are never lost.
+    """
+
+    def __init__(self, path, max_batch=256, busy_timeout_ms=5000):
+        self.path = path
+        self.max_batch = max_batch
+        self.busy_timeout_ms = busy_timeout_ms
+        self.local = threading.local()
+        self.writes = queue.Queue()
+        db = self._connect()
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                level TEXT NOT NULL,
+                feedback_points REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS feedback_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                feedback TEXT NOT NULL,
+                level_before TEXT NOT NULL,
+                level_after TEXT NOT NULL,
+                feedback_points REAL NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS feedback_events_user ON feedback_events (user_id, id);
+        ''')
+        threading.Thread(target=self._write_loop, name='user-store-writer', daemon=True).start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute(f'PRAGMA busy_timeout={self.busy_timeout_ms}')
+        return db
+
+    def _reader(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = self._connect()
+        return db
+
+    # Function to queue a write and wait for the transaction that applies it
+    def _submit(self, operation, *args):
+        future = Future()
+        self.writes.put((operation, args, future))
+        return future.result()
+
+    def _write_loop(self):
+        db = self._connect()
+        while True:
+            pending = [self.writes.get()]
+            while len(pending) < self.max_batch:
+                try:
+                    pending.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+            results = []
+            try:
+                db.execute('BEGIN IMMEDIATE')
+                for operation, args, future in pending:
+                    # A savepoint per write keeps one failure from undoing the rest of the batch
+                    db.execute('SAVEPOINT write')
+                    try:
+                        results.append((future, operation(db, *args), None))
+                        db.execute('RELEASE write')
+                    except Exception as e:
+                        db.execute('ROLLBACK TO write')
+                        db.execute('RELEASE write')
+                        results.append((future, None, e))
+                db.execute('COMMIT')
+            except Exception as e:
+                if db.in_transaction:
+                    db.execute('ROLLBACK')
+                results = [(future, None, e) for _, _, future in pending]
+            for future, result, error in results:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+    @staticmethod
+    def _read_user(db, user_id):
+        row = db.execute('SELECT level, feedback_points FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        return {'level': row[0], 'feedback_points': row[1]} if row else None
+
+    @staticmethod
+    def _create_user(db, user_id):
+        db.execute('INSERT OR IGNORE INTO users VALUES (?, ?, 0, ?)', (user_id, default_level, time.time()))
+        return SQLiteUserStore._read_user(db, user_id)
+
+    @staticmethod
+    def _set_level(db, user_id, level):
+        db.execute('INSERT INTO users VALUES (?, ?, 0, ?) ON CONFLICT(user_id) DO UPDATE SET '
+                   'level = excluded.level, feedback_points = 0, updated_at = excluded.updated_at',
+                   (user_id, level, time.time()))
+        return {'level': level, 'feedback_points': 0}
+
+    @staticmethod
+    def _record_feedback(db, user_id, feedback):
+        user = SQLiteUserStore._create_user(db, user_id)
+        level, points = apply_feedback(user['level'], user['feedback_points'], feedback)
+        now = time.time()
+        db.execute('UPDATE users SET level = ?, feedback_points = ?, updated_at = ? WHERE user_id = ?',
+                   (level, points, now, user_id))
+        db.execute('INSERT INTO feedback_events (user_id, feedback, level_before, level_after, feedback_points, '
+                   'created_at) VALUES (?, ?, ?, ?, ?, ?)', (user_id, feedback, user['level'], level, points, now))
+        return {'level': level, 'feedback_points': points}
+
+    # Function to read a learner's profile; a row is only written by set_level or record_feedback
+    def get_user(self, user_id):
+        user = self._read_user(self._reader(), user_id)
+        return user if user is not None else {'level': default_level, 'feedback_points': 0}
+
+    def set_level(self, user_id, level):
+        if level not in cefr_levels:
+            raise ValueError(f"Unknown level '{level}'.")
+        return self._submit(self._set_level, user_id, level)
+
+    def record_feedback(self, user_id, feedback):
+        if feedback not in feedback_points:
+            raise ValueError(f"Unknown feedback '{feedback}'.")
+        return self._submit(self._record_feedback, user_id, feedback)
+
+    def feedback_history(self, user_id, limit=50):
+        rows = self._reader().execute(
+            'SELECT feedback, level_before, level_after, feedback_points, created_at FROM feedback_events '
+            'WHERE user_id = ? ORDER BY id DESC LIMIT ?', (user_id, limit)).fetchall()
+        return [dict(zip(['feedback', 'level_before', 'level_after', 'feedback_points', 'created_at'], row))
+                for row in rows]
+
+
+# Function to get the user store shared by every session in this process
+def get_user_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SQLiteUserStore(os.getenv('USER_STORE_PATH', 'users.sqlite3'))
+        return _store
@@ -0,0 +1,92 @@
+# Benchmark: accuracy parity, latency and memory of each inference backend
+import argparse
+import csv
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_root, 'app'))
+
+
+# Function to read the labelled training sentences
+def load_labelled(path, limit=None):
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = [(row['sentence'], row['difficulty']) for row in csv.DictReader(f)]
+    return rows[:limit] if limit else rows
+
+
+# Function to measure one backend in this process and return its results
+def measure(name, args):
+    from backends import get_backend
+    from model_registry import current_rss_bytes
+    from scoring import cefr_levels
+
+    rows = load_labelled(args.data, args.limit)
+    sentences = [sentence for sentence, _ in rows]
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    backend = get_backend(name, args.model_dir)
+    load_seconds = time.perf_counter() - start
+    rss_after_load = current_rss_bytes()
+
+    single = []
+    for sentence in sentences[:args.latency_samples]:
+        start = time.perf_counter()
+        backend.score_texts([sentence])
+        single.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    levels, _ = backend.score_texts(sentences)
+    batched_seconds = time.perf_counter() - start
+
+    assert set(levels) <= set(cefr_levels)
+    return {
+        'backend': name,
+        'load_seconds': load_seconds,
+        'model_rss_mb': (rss_after_load - rss_before) / 2**20,
+        'peak_rss_mb': current_rss_bytes() / 2**20,
+        'latency_p50_ms': statistics.median(single) * 1000,
+        'sentences_per_second': len(sentences) / batched_seconds,
+        'accuracy': sum(level == label for level, (_, label) in zip(levels, rows)) / len(rows),
+        'levels': levels,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare inference backends on data/training_data.csv.')
+    parser.add_argument('--backends', default='torch,torch-int8,onnx')
+    parser.add_argument('--model-dir', default=os.path.join(repo_root, 'app'))
+    parser.add_argument('--data', default=os.path.join(repo_root, 'data', 'training_data.csv'))
+    parser.add_argument('--limit', type=int, default=None, help='Only use the first N labelled sentences')
+    parser.add_argument('--latency-samples', type=int, default=50)
+    parser.add_argument('--only', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.only:
+        print(json.dumps(measure(args.only, args)))
+        return
+
+    # Each backend runs in a fresh process so memory figures do not include the others
+    results = []
+    for name in args.backends.split(','):
+        command = [sys.executable, os.path.abspath(__file__), '--only', name, '--model-dir', args.model_dir,
+                   '--data', args.data, '--latency-samples', str(args.latency_samples)]
+        if args.limit:
+            command += ['--limit', str(args.limit)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    reference = results[0]['levels']
+    print(f"{'backend':<11} {'load s':>7} {'model MB':>9} {'p50 ms':>7} {'sent/s':>8} {'accuracy':>9} {'parity':>7}")
+    for result in results:
+        parity = sum(a == b for a, b in zip(result['levels'], reference)) / len(reference)
+        print(f"{result['backend']:<11} {result['load_seconds']:>7.2f} {result['model_rss_mb']:>9.0f} "
+              f"{result['latency_p50_ms']:>7.1f} {result['sentences_per_second']:>8.1f} "
+              f"{result['accuracy']:>9.2%} {parity:>7.2%}")
+
+
+if __name__ == '__main__':
+    main()
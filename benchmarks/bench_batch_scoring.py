@@ -0,0 +1,65 @@
+# Benchmark: batched, bucketed scoring vs. the one-article-at-a-time loop
+import argparse
+import csv
+import os
+import sys
+import time
+
+import torch
+from transformers import CamembertTokenizer, CamembertForSequenceClassification
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+from scoring import cefr_levels, score_texts  # noqa: E402
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+# Function to read the sentences of the unlabelled test set
+def load_sentences(path, limit=None):
+    with open(path, newline='', encoding='utf-8') as f:
+        sentences = [row['sentence'] for row in csv.DictReader(f)]
+    return sentences[:limit] if limit else sentences
+
+
+# The per-article scoring loop the feed used before batching
+def score_one_by_one(texts, model, tokenizer):
+    levels = []
+    for text in texts:
+        inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
+        with torch.no_grad():
+            outputs = model(**inputs)
+            levels.append(cefr_levels[outputs.logits.argmax(-1).item()])
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare batched scoring with the per-article loop.')
+    parser.add_argument('--model-dir', default=os.path.join(repo_root, 'app'))
+    parser.add_argument('--data', default=os.path.join(repo_root, 'data', 'unlabelled_test_data.csv'))
+    parser.add_argument('--limit', type=int, default=None, help='Only score the first N sentences')
+    parser.add_argument('--batch-size', type=int, default=16)
+    args = parser.parse_args()
+
+    tokenizer = CamembertTokenizer.from_pretrained(args.model_dir)
+    model = CamembertForSequenceClassification.from_pretrained(args.model_dir)
+    model.eval()
+    sentences = load_sentences(args.data, args.limit)
+
+    start = time.perf_counter()
+    loop_levels = score_one_by_one(sentences, model, tokenizer)
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched_levels, _ = score_texts(sentences, model, tokenizer, batch_size=args.batch_size)
+    batched_seconds = time.perf_counter() - start
+
+    agreement = sum(a == b for a, b in zip(loop_levels, batched_levels)) / len(sentences)
+    print(f"sentences:         {len(sentences)}")
+    print(f"per-article loop:  {len(sentences) / loop_seconds:8.1f} articles/sec ({loop_seconds:.2f}s)")
+    print(f"batched (bs={args.batch_size:<3}): {len(sentences) / batched_seconds:8.1f} articles/sec ({batched_seconds:.2f}s)")
+    print(f"speedup:           {loop_seconds / batched_seconds:8.2f}x")
+    print(f"level agreement:   {agreement:8.2%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Benchmark: escalation rate, accuracy and latency of the feature-classifier cascade across thresholds
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_root, 'app'))
+from fallback_classifier import load_labelled, train_classifier  # noqa: E402
+from model_registry import create_tiny_model, get_model, has_model_weights  # noqa: E402
+from scoring import LocalScorer, cefr_levels  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep the cascade threshold on a held-out split of data/training_data.csv.')
+    parser.add_argument('--model-dir', default=os.path.join(repo_root, 'app'))
+    parser.add_argument('--data', default=os.path.join(repo_root, 'data', 'training_data.csv'))
+    parser.add_argument('--validation-fraction', type=float, default=0.2)
+    parser.add_argument('--thresholds', default='0,0.5,0.6,0.7,0.8,0.9,0.95,1.01')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    model_dir = args.model_dir
+    if not has_model_weights(model_dir):
+        model_dir = create_tiny_model(os.path.join(tempfile.gettempdir(), 'cefr-tiny-model'))
+        print('model weights not found, using the tiny random model: transformer accuracy is meaningless')
+    texts, labels = load_labelled(args.data)
+    order = np.random.default_rng(args.seed).permutation(len(texts))
+    held_out = order[:int(len(texts) * args.validation_fraction)]
+    train_rows = order[len(held_out):]
+    classifier = train_classifier([texts[i] for i in train_rows], [labels[i] for i in train_rows], seed=args.seed)
+    texts = [texts[i] for i in held_out]
+    truth = np.asarray([cefr_levels.index(labels[i]) for i in held_out])
+
+    # Each stage runs once over the whole split; a threshold only decides which answer is kept
+    classifier.predict_proba(texts[:8])
+    start = time.perf_counter()
+    fallback = classifier.predict_proba(texts)
+    fallback_seconds = time.perf_counter() - start
+    single = []
+    for text in texts[:200]:
+        start = time.perf_counter()
+        classifier.predict_proba([text])
+        single.append(time.perf_counter() - start)
+    scorer = LocalScorer(*get_model(model_dir))
+    start = time.perf_counter()
+    _, transformer = scorer.score_texts(texts)
+    transformer_seconds = time.perf_counter() - start
+    transformer = np.asarray(transformer)
+
+    print(f"{len(texts)} held-out sentences; feature classifier p50 {np.median(single) * 1e6:.0f} us/text, "
+          f"transformer {transformer_seconds / len(texts) * 1000:.2f} ms/text")
+    print(f"{'threshold':>9} {'escalated':>10} {'accuracy':>9} {'±1 level':>9} {'ms/text':>8} {'speed-up':>9}")
+    for threshold in (float(value) for value in args.thresholds.split(',')):
+        escalated = fallback.max(axis=-1) < threshold
+        predicted = np.where(escalated, transformer.argmax(axis=-1), fallback.argmax(axis=-1))
+        seconds = fallback_seconds + transformer_seconds * escalated.mean()
+        print(f"{threshold:>9.2f} {escalated.mean():>10.1%} {(predicted == truth).mean():>9.1%} "
+              f"{(abs(predicted - truth) <= 1).mean():>9.1%} {seconds / len(texts) * 1000:>8.3f} "
+              f"{transformer_seconds / seconds:>8.1f}x")
+    print(f"{'model':>9} {'100.0%':>10} {(transformer.argmax(axis=-1) == truth).mean():>9.1%}")
+
+
+if __name__ == '__main__':
+    main()
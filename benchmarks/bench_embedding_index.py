@@ -0,0 +1,81 @@
+# Benchmark: build size and lookup latency of the memory-mapped reference embedding index
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_root, 'app'))
+from embedding_index import AdaptiveAssessment, EmbeddingIndex, assessment_answers, build_index  # noqa: E402
+from ingestion import FeedIndex  # noqa: E402
+from model_registry import create_tiny_model, get_model, has_model_weights  # noqa: E402
+from scoring import cefr_levels  # noqa: E402
+
+
+# Function to time function over repeats calls, returning (p50, p99) in milliseconds
+def latency(function, repeats):
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        function(i)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[min(len(times) - 1, int(0.99 * len(times)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the reference index of data/training_data.csv and time lookups.')
+    parser.add_argument('--model-dir', default=os.path.join(repo_root, 'app'))
+    parser.add_argument('--data', default=os.path.join(repo_root, 'data', 'training_data.csv'))
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    model_dir = args.model_dir
+    if not has_model_weights(model_dir):
+        model_dir = create_tiny_model(os.path.join(tempfile.gettempdir(), 'cefr-tiny-model'))
+    model, tokenizer = get_model(model_dir)
+    with tempfile.TemporaryDirectory() as directory:
+        prefix = os.path.join(directory, 'reference_index')
+        start = time.perf_counter()
+        build_index(args.data, prefix, model, tokenizer)
+        build_seconds = time.perf_counter() - start
+        size = sum(os.path.getsize(prefix + suffix) for suffix in ['.embeddings.npy', '.probabilities.npy'])
+        start = time.perf_counter()
+        index = EmbeddingIndex(prefix)
+        open_ms = (time.perf_counter() - start) * 1000
+        print(f"{len(index)} sentences, hidden size {index.embeddings.shape[1]}: built in {build_seconds:.1f}s, "
+              f"{size / 2**20:.2f} MiB float16, opened in {open_ms:.1f} ms")
+
+        rng = np.random.default_rng(0)
+        queries = rng.integers(0, len(index), args.repeats)
+        positions = rng.uniform(0, len(cefr_levels) - 1, args.repeats)
+
+        def assessment(_):
+            session = AdaptiveAssessment()
+            answers = list(assessment_answers)
+            while not session.done():
+                session.next_item(index)
+                session.record(answers[int(rng.integers(len(answers)))])
+
+        # A category holding 50 scored articles per level, as the feed index keeps at most
+        feed = FeedIndex()
+        articles = [{'url': str(i), 'level': cefr_levels[i % 6],
+                     'probabilities': rng.dirichlet(np.ones(len(cefr_levels))).tolist()} for i in range(300)]
+        feed.add('general', articles)
+
+        rows = [('search, top 10', latency(lambda i: index.search(index.embeddings[queries[i]], 10), args.repeats)),
+                ('near level, top 20', latency(lambda i: index.near_level(positions[i], 20), args.repeats)),
+                ('full assessment', latency(assessment, max(args.repeats // 10, 1))),
+                ('feed near, 300 articles', latency(lambda i: feed.near('general', positions[i],
+                                                                        calibrate=index.calibrate), args.repeats))]
+        for name, (p50, p99) in rows:
+            print(f"{name:<24} p50 {p50:7.3f} ms  p99 {p99:7.3f} ms")
+        del index
+
+
+if __name__ == '__main__':
+    main()
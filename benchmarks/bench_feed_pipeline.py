@@ -0,0 +1,148 @@
+# Benchmark: time to first article of the streaming feed pipeline vs. the batch path, against local stub servers
+import argparse
+import csv
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_root, 'app'))
+from feed_pipeline import FeedPipeline, article_text, iter_articles  # noqa: E402
+from image_validation import ImageValidator  # noqa: E402
+from ingestion import MediastackSource  # noqa: E402
+from instrumentation import inc  # noqa: E402
+from model_registry import create_tiny_model, get_model, has_model_weights  # noqa: E402
+from prediction_cache import PredictionCache, cached_score_texts  # noqa: E402
+from scoring import LocalScorer  # noqa: E402
+
+
+# Stub news API and image host: /v1/news answers like mediastack, HEAD /img/<ms>.png after <ms> milliseconds
+class StubHandler(BaseHTTPRequestHandler):
+    fetch_delay = 0.3
+    articles = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        offset, limit = int(query['offset'][0]), int(query['limit'][0])
+        time.sleep(self.fetch_delay)
+        payload = json.dumps({'data': self.articles[offset:offset + limit]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_HEAD(self):
+        name = os.path.basename(urlparse(self.path).path)
+        time.sleep(int(name.split('.')[0]) / 1000)
+        self.send_response(200 if name.endswith('.png') else 404)
+        self.send_header('Content-Type', 'image/png' if name.endswith('.png') else 'text/html')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to make articles whose images answer fast, slowly, too slowly or not at all
+def make_articles(count, base_url, seed):
+    rng = random.Random(seed)
+    with open(os.path.join(repo_root, 'data', 'unlabelled_test_data.csv'), newline='', encoding='utf-8') as f:
+        sentences = [row['sentence'] for _, row in zip(range(count), csv.DictReader(f))]
+    articles = []
+    for i, sentence in enumerate(sentences):
+        delay = rng.choices([30, 300, 1500, 6000], weights=[70, 20, 7, 3])[0]
+        extension = 'png' if rng.random() > 0.1 else 'html'
+        articles.append({'title': sentence[:60], 'description': sentence, 'url': f'{base_url}/article/{i}',
+                         'image': f'{base_url}/img/{delay}.{extension}?article={i}',
+                         'category': 'general'})
+    return articles
+
+
+# Function to give levels to the articles that have a valid image, as the feed did before the pipeline
+def predict_article_levels(articles, scorer, cache, validator):
+    # Validate all images concurrently, then score the valid articles in one batched pass
+    valid_images = validator.validate_many([article.get('image') for article in articles])
+    scored = [article for article in articles if valid_images[article.get('image')]]
+    inc('articles_dropped_total', len(articles) - len(scored), reason='invalid_image')
+    texts = [article_text(article) for article in scored]
+    levels, probabilities = cached_score_texts(texts, scorer, cache)
+    for article, level, row in zip(scored, levels, probabilities):
+        article['level'] = level
+        article['probabilities'] = row
+    return articles
+
+
+# The pre-pipeline path: fetch every page, validate and score everything, then show the page
+def batch_session(source, scorer, pages, page_size, cache, validator):
+    start = time.perf_counter()
+    articles = []
+    for page in range(pages):
+        articles += source.fetch('general', offset=page * page_size, limit=page_size)
+    shown = [article for article in predict_article_levels(articles, scorer, cache, validator) if 'level' in article]
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, len(shown)
+
+
+def pipeline_session(source, scorer, pages, page_size, cache, validator):
+    start = time.perf_counter()
+    first = None
+    shown = 0
+    pipeline = FeedPipeline(source, scorer, cache, validator, pages=pages, page_size=page_size)
+    for _ in iter_articles(pipeline, 'general'):
+        first = first or time.perf_counter() - start
+        shown += 1
+    return first, time.perf_counter() - start, shown
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare time to first article of the batch and streaming feed paths.')
+    parser.add_argument('--model-dir', default=os.path.join(repo_root, 'app'))
+    parser.add_argument('--sessions', type=int, default=8, help='Page views served concurrently')
+    parser.add_argument('--pages', type=int, default=2)
+    parser.add_argument('--page-size', type=int, default=25)
+    parser.add_argument('--fetch-delay', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    model_dir = args.model_dir
+    if not has_model_weights(model_dir):
+        model_dir = create_tiny_model(os.path.join(tempfile.gettempdir(), 'cefr-tiny-model'))
+    scorer = LocalScorer(*get_model(model_dir))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    StubHandler.fetch_delay = args.fetch_delay
+    StubHandler.articles = make_articles(args.pages * args.page_size, base_url, args.seed)
+
+    print(f"{args.sessions} concurrent sessions, {args.pages}x{args.page_size} articles each")
+    print(f"{'path':<9} {'first p50 s':>12} {'first p95 s':>12} {'page done s':>12} {'shown':>6}")
+    for name, session in [('batch', batch_session), ('pipeline', pipeline_session)]:
+        with tempfile.TemporaryDirectory() as directory:
+            # Fresh caches per path so neither benefits from the other's work
+            cache = PredictionCache(os.path.join(directory, 'cache.sqlite3'), 'bench')
+            validator = ImageValidator()
+            source = MediastackSource('stub')
+            source.base_url = f'{base_url}/v1/news'
+            with ThreadPoolExecutor(args.sessions) as executor:
+                results = list(executor.map(lambda _: session(source, scorer, args.pages, args.page_size, cache,
+                                                              validator), range(args.sessions)))
+            cache.close()
+        firsts = sorted(first for first, _, _ in results if first is not None)
+        p95 = firsts[min(len(firsts) - 1, int(0.95 * len(firsts)))] if firsts else float('nan')
+        print(f"{name:<9} {statistics.median(firsts) if firsts else float('nan'):>12.2f} {p95:>12.2f} "
+              f"{statistics.median(total for _, total, _ in results):>12.2f} "
+              f"{statistics.median(shown for _, _, shown in results):>6.0f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# Benchmark: concurrent image validation against a local stub HTTP server
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+from image_validation import ImageValidator  # noqa: E402
+
+
+# Stub image host: /img/* answers as a PNG, anything else is a 404, all after a fixed delay
+class StubImageHandler(BaseHTTPRequestHandler):
+    delay = 0.2
+
+    def do_HEAD(self):
+        time.sleep(self.delay)
+        if self.path.startswith('/img/'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+        else:
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/html')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to start the stub server on a free local port
+def start_stub_server(delay):
+    StubImageHandler.delay = delay
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# The sequential check the app used before, run twice per article as main() did
+def validate_sequentially(urls):
+    results = {}
+    for _ in range(2):
+        for url in urls:
+            try:
+                response = requests.head(url, timeout=5)
+                results[url] = response.status_code == 200 and 'image' in response.headers.get('Content-Type', '')
+            except requests.RequestException:
+                results[url] = False
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sequential and concurrent image validation offline.')
+    parser.add_argument('--articles', type=int, default=25)
+    parser.add_argument('--delay', type=float, default=0.2, help='Stub server latency per request in seconds')
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    server = start_stub_server(args.delay)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    # Every fifth article points at a missing image and a few share the same image
+    urls = [f"{base}/missing/{i}" if i % 5 == 0 else f"{base}/img/{i % (args.articles - 3)}"
+            for i in range(args.articles)]
+
+    start = time.perf_counter()
+    expected = validate_sequentially(urls)
+    sequential_seconds = time.perf_counter() - start
+
+    validator = ImageValidator(max_workers=args.workers)
+    start = time.perf_counter()
+    cold = validator.validate_many(urls)
+    cold_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    warm = validator.validate_many(urls)
+    warm_seconds = time.perf_counter() - start
+    server.shutdown()
+
+    assert cold == expected and warm == expected, 'concurrent validation disagrees with the sequential check'
+    print(f"articles:            {args.articles} ({len(set(urls))} distinct URLs)")
+    print(f"sequential (x2):     {sequential_seconds:8.3f}s")
+    print(f"concurrent, cold:    {cold_seconds:8.3f}s  ({sequential_seconds / cold_seconds:.1f}x faster)")
+    print(f"concurrent, cached:  {warm_seconds * 1000:8.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+# Benchmark: per-call cost of the instrumentation hooks with metrics disabled and enabled
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+import instrumentation  # noqa: E402
+
+
+def hooks():
+    with instrumentation.timer('bench'):
+        pass
+    instrumentation.inc('bench_total')
+    instrumentation.observe('batch_size', 16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the overhead of timer(), inc() and observe().')
+    parser.add_argument('--number', type=int, default=200000)
+    args = parser.parse_args()
+
+    baseline = min(timeit.repeat(lambda: None, number=args.number, repeat=5)) / args.number
+    modes = [('disabled', False, False), ('enabled', True, False), ('profiling', True, True)]
+    for label, enabled, profiling in modes:
+        instrumentation.enable(enabled)
+        if profiling:
+            instrumentation.start_profiling()
+        per_call = min(timeit.repeat(hooks, number=args.number, repeat=5)) / args.number
+        print(f"{label:<10} {(per_call - baseline) * 1e9:8.0f} ns for one timer + inc + observe")
+    instrumentation.stop_profiling(os.devnull)
+
+
+if __name__ == '__main__':
+    main()
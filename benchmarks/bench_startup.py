@@ -0,0 +1,58 @@
+# Benchmark: cold-start import time, time to first render and time until the model is ready
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+app_dir = os.path.join(repo_root, 'app')
+
+
+# Function to measure one startup stage inside a fresh interpreter
+def measure_stage(stage, model_dir):
+    sys.path.insert(0, app_dir)
+    start = time.perf_counter()
+    if stage == 'import':
+        import streamlit_app  # noqa: F401
+        result = {'seconds': time.perf_counter() - start,
+                  'torch_imported': 'torch' in sys.modules, 'transformers_imported': 'transformers' in sys.modules}
+    elif stage == 'first_render':
+        from streamlit.testing.v1 import AppTest
+        app = AppTest.from_file(os.path.join(app_dir, 'streamlit_app.py'), default_timeout=120)
+        app.run()
+        result = {'seconds': time.perf_counter() - start, 'torch_imported': 'torch' in sys.modules}
+    else:
+        from model_registry import get_model
+        get_model(model_dir)
+        result = {'seconds': time.perf_counter() - start}
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-start costs of the Streamlit app in fresh processes.')
+    parser.add_argument('--model-dir', default=app_dir)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stage', choices=['import', 'first_render', 'model_ready'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        measure_stage(args.stage, args.model_dir)
+        return
+
+    print(f"{'stage':<14} {'best s':>8} {'median s':>9}  notes")
+    for stage in ['import', 'first_render', 'model_ready']:
+        runs = []
+        for _ in range(args.repeat):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--stage', stage,
+                                     '--model-dir', args.model_dir],
+                                    check=True, capture_output=True, text=True, cwd=app_dir).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        seconds = sorted(run['seconds'] for run in runs)
+        notes = ', '.join(f"{key}={value}" for key, value in runs[0].items() if key != 'seconds')
+        print(f"{stage:<14} {seconds[0]:>8.2f} {seconds[len(seconds) // 2]:>9.2f}  {notes}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+# Benchmark suite: throughput, latency, memory and accuracy of scoring, with a JSON baseline and regression check
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_root, 'app'))
+from model_registry import create_tiny_model, get_model, has_model_weights  # noqa: E402
+from prediction_cache import model_fingerprint  # noqa: E402
+from scoring import cefr_levels, encode_texts, probabilities_to_levels, score_encoded  # noqa: E402
+
+# Sequence-length buckets in tokens (including special tokens): name -> (min, max)
+length_buckets = {'short': (0, 24), 'medium': (25, 48), 'long': (49, 512)}
+
+# Metrics compared against the baseline and whether a higher value is better
+compared_metrics = {'sentences_per_sec': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False}
+
+
+def load_rows(path, limit, seed):
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    if limit and limit < len(rows):
+        rows = random.Random(seed).sample(rows, limit)
+    return rows
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == 'Darwin' else peak * 1024
+
+
+# Function to score fixed-size batches of one length bucket, timing every batch
+def measure(encoded, model, pad_token_id, batch_size, repeat):
+    batches = [encoded[i:i + batch_size] for i in range(0, len(encoded), batch_size)]
+    score_encoded(batches[0], model, pad_token_id, batch_size)  # warm-up
+    latencies = []
+    passes = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for batch in batches:
+            batch_start = time.perf_counter()
+            score_encoded(batch, model, pad_token_id, batch_size)
+            latencies.append(time.perf_counter() - batch_start)
+        passes.append(time.perf_counter() - start)
+    # Throughput from the fastest pass, latency percentiles over every batch of every pass
+    return {
+        'sentences': len(encoded),
+        'sentences_per_sec': len(encoded) / min(passes),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def run(args):
+    import torch
+    import transformers
+
+    if args.tiny or not has_model_weights(args.model_dir):
+        model_name = 'tiny'
+        model_dir = create_tiny_model(os.path.join(tempfile.gettempdir(), 'cefr-tiny-model'), seed=args.seed)
+        print("Using the tiny random model: accuracy is only meaningful against a tiny-model baseline", file=sys.stderr)
+    else:
+        # Reports are keyed on the weights themselves, so a baseline follows the model across checkouts
+        model_name = model_fingerprint(args.model_dir)
+        model_dir = args.model_dir
+    model, tokenizer = get_model(model_dir)
+    torch.manual_seed(args.seed)
+
+    # Accuracy on a fixed sample of the labelled data
+    labelled = load_rows(args.labelled, args.accuracy_limit, args.seed)
+    encoded = encode_texts([row['sentence'] for row in labelled], tokenizer, args.max_length)
+    probabilities = score_encoded(encoded, model, tokenizer.pad_token_id, max(args.batch_sizes))
+    predicted = probabilities_to_levels(probabilities)
+    accuracy = sum(p == row['difficulty'] for p, row in zip(predicted, labelled)) / len(labelled)
+    adjacent = sum(abs(cefr_levels.index(p) - cefr_levels.index(row['difficulty'])) <= 1
+                   for p, row in zip(predicted, labelled)) / len(labelled)
+
+    # Throughput and latency on the unlabelled data, per length bucket, batch size and thread count
+    sentences = [row['sentence'] for row in load_rows(args.unlabelled, args.limit, args.seed)]
+    encoded = encode_texts(sentences, tokenizer, args.max_length)
+    results = []
+    for bucket, (low, high) in length_buckets.items():
+        bucket_encoded = [ids for ids in encoded if low <= len(ids) <= high]
+        if not bucket_encoded:
+            continue
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            for batch_size in args.batch_sizes:
+                result = measure(bucket_encoded, model, tokenizer.pad_token_id, batch_size, args.repeat)
+                result.update({'bucket': bucket, 'threads': threads, 'batch_size': batch_size})
+                results.append(result)
+                print(f"{bucket:<7} threads={threads:<2} bs={batch_size:<3} {result['sentences_per_sec']:9.1f} sent/s  "
+                      f"p50 {result['p50_ms']:7.2f}ms  p95 {result['p95_ms']:7.2f}ms  p99 {result['p99_ms']:7.2f}ms",
+                      file=sys.stderr)
+
+    report = {
+        'meta': {
+            'model': model_name, 'model_dir': os.path.abspath(model_dir), 'seed': args.seed, 'limit': args.limit,
+            'accuracy_limit': args.accuracy_limit, 'max_length': args.max_length, 'repeat': args.repeat,
+            'python': platform.python_version(),
+            'torch': torch.__version__, 'transformers': transformers.__version__, 'machine': platform.machine(),
+            'cpu_count': os.cpu_count(), 'created_at': time.time(),
+        },
+        'accuracy': accuracy,
+        'adjacent_accuracy': adjacent,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"accuracy {accuracy:.2%} (within one level {adjacent:.2%}), peak RSS {report['peak_rss_bytes'] / 2**20:.0f} MiB, "
+          f"written to {args.output}", file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline) as f:
+            return compare_reports(json.load(f), report, args.threshold, args.accuracy_threshold)
+    return 0
+
+
+# Function to list every regression of current against baseline; returns the process exit code
+def compare_reports(baseline, current, threshold, accuracy_threshold):
+    if baseline['meta']['model'] != current['meta']['model']:
+        print(f"Baseline was measured on model {baseline['meta']['model']!r}, not {current['meta']['model']!r}")
+        return 2
+    regressions = []
+    if current['accuracy'] < baseline['accuracy'] - accuracy_threshold:
+        regressions.append(f"accuracy {baseline['accuracy']:.2%} -> {current['accuracy']:.2%}")
+    if current['peak_rss_bytes'] > baseline['peak_rss_bytes'] * (1 + threshold):
+        regressions.append(f"peak RSS {baseline['peak_rss_bytes'] / 2**20:.0f} -> {current['peak_rss_bytes'] / 2**20:.0f} MiB")
+    key = lambda result: (result['bucket'], result['threads'], result['batch_size'])  # noqa: E731
+    baseline_results = {key(result): result for result in baseline['results']}
+    for result in current['results']:
+        before = baseline_results.get(key(result))
+        if before is None:
+            continue
+        for metric, higher_is_better in compared_metrics.items():
+            change = (result[metric] - before[metric]) / before[metric]
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{'/'.join(map(str, key(result)))} {metric}: "
+                                   f"{before[metric]:.2f} -> {result[metric]:.2f} ({change:+.1%})")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions beyond {threshold:.0%} (accuracy {accuracy_threshold:.1%})")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark scoring and compare the results with a JSON baseline.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the suite and write a JSON report')
+    run_parser.add_argument('--model-dir', default=os.path.join(repo_root, 'app'))
+    run_parser.add_argument('--tiny', action='store_true', help='Use the tiny random model even if weights exist')
+    run_parser.add_argument('--labelled', default=os.path.join(repo_root, 'data', 'training_data.csv'))
+    run_parser.add_argument('--unlabelled', default=os.path.join(repo_root, 'data', 'unlabelled_test_data.csv'))
+    run_parser.add_argument('--limit', type=int, default=600, help='Unlabelled sentences used for timing')
+    run_parser.add_argument('--accuracy-limit', type=int, default=1000, help='Labelled sentences used for accuracy')
+    run_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    run_parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, os.cpu_count() or 1}))
+    run_parser.add_argument('--max-length', type=int, default=512)
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--output', default='bench_results.json')
+    run_parser.add_argument('--baseline', help='Also compare the new report with this baseline')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two JSON reports')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+
+    for subparser in (run_parser, compare_parser):
+        subparser.add_argument('--threshold', type=float, default=0.10,
+                               help='Allowed relative slowdown in throughput, latency or memory')
+        subparser.add_argument('--accuracy-threshold', type=float, default=0.01,
+                               help='Allowed absolute drop in accuracy')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        sys.exit(run(args))
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    sys.exit(compare_reports(baseline, current, args.threshold, args.accuracy_threshold))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Benchmark: per-text tokenization vs. batched fast tokenizer vs. token cache vs. pre-tokenized memory map
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_root, 'app'))
+from model_registry import create_tiny_model, get_tokenizer, has_model_weights  # noqa: E402
+from tokenization import PretokenizedCorpus, TokenCache, pretokenize  # noqa: E402
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the ways of getting token ids for a corpus.')
+    parser.add_argument('--model-dir', default=os.path.join(repo_root, 'app'))
+    parser.add_argument('--data', default=os.path.join(repo_root, 'data', 'training_data.csv'))
+    parser.add_argument('--max-length', type=int, default=512)
+    args = parser.parse_args()
+
+    model_dir = args.model_dir
+    if not has_model_weights(model_dir):
+        # Only the tokenizer is used, and the tiny model directory carries the real one
+        model_dir = create_tiny_model(os.path.join(tempfile.gettempdir(), 'cefr-tiny-model'))
+    tokenizer = get_tokenizer(model_dir)
+    with open(args.data, newline='', encoding='utf-8') as f:
+        sentences = [row['sentence'] for row in csv.DictReader(f)]
+
+    def one_by_one():
+        return [tokenizer(text, truncation=True, max_length=args.max_length)['input_ids'] for text in sentences]
+
+    def batched():
+        return tokenizer(sentences, truncation=True, max_length=args.max_length, padding=False)['input_ids']
+
+    cache = TokenCache(tokenizer, max_entries=len(sentences))
+    rows = [('per-text calls', *timed(one_by_one)), ('one batch call', *timed(batched)),
+            ('cache, cold', *timed(lambda: cache.encode(sentences, args.max_length))),
+            ('cache, warm', *timed(lambda: cache.encode(sentences, args.max_length)))]
+
+    with tempfile.TemporaryDirectory() as directory:
+        prefix = os.path.join(directory, 'corpus')
+        write_seconds, corpus = timed(lambda: pretokenize(args.data, prefix, tokenizer, args.max_length))
+        rows.append(('pre-tokenize (offline)', write_seconds, corpus.encoded()))
+        rows.append(('memory map, open', *timed(lambda: PretokenizedCorpus(prefix))))
+        rows.append(('memory map, to lists', *timed(lambda: PretokenizedCorpus(prefix).encoded())))
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        del corpus
+
+    expected = batched()
+    print(f"{len(sentences)} sentences, pre-tokenized files {size / 2**10:.0f} KiB")
+    for name, seconds, result in rows:
+        same = '' if isinstance(result, PretokenizedCorpus) else ('ok' if list(map(list, result)) == expected else 'MISMATCH')
+        print(f"{name:<24} {seconds * 1000:9.1f} ms  {len(sentences) / seconds:12.0f} texts/s  {same}")
+
+
+if __name__ == '__main__':
+    main()
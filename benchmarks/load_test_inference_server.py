@@ -0,0 +1,104 @@
+# Load test: throughput and tail latency of the inference service as worker count grows
+import argparse
+import csv
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_root, 'app'))
+from inference_client import InferenceClient  # noqa: E402
+
+
+# Function to read the sentences of the unlabelled test set
+def load_sentences(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [row['sentence'] for row in csv.DictReader(f)]
+
+
+# Function to start a server process and wait until all its workers have loaded the model
+def start_server(args, workers, port):
+    command = [sys.executable, os.path.join(repo_root, 'app', 'inference_server.py'), '--port', str(port),
+               '--workers', str(workers), '--threads-per-worker', str(args.threads_per_worker),
+               '--max-batch-size', str(args.max_batch_size), '--max-wait-ms', str(args.max_wait_ms)]
+    if args.model_dir:
+        command += ['--model-dir', args.model_dir]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    client = InferenceClient(f"http://127.0.0.1:{port}")
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        try:
+            if client.health()['ready']:
+                return process, client
+        except Exception:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"server with {workers} workers did not become ready")
+
+
+# Function to run concurrent clients against the server and return per-request latencies
+def run_load(client, sentences, concurrency, duration, texts_per_request):
+    latencies = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def user(seed):
+        rng = random.Random(seed)
+        while time.monotonic() < stop_at:
+            texts = rng.sample(sentences, texts_per_request)
+            start = time.perf_counter()
+            client.score_texts(texts)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=user, args=(seed,)) for seed in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+# Function to read a percentile from a sorted list
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the inference service at several worker counts.')
+    parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker counts to try')
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--concurrency', type=int, default=32, help='Simultaneous client threads')
+    parser.add_argument('--texts-per-request', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of load per worker count')
+    parser.add_argument('--model-dir', default=None)
+    parser.add_argument('--data', default=os.path.join(repo_root, 'data', 'unlabelled_test_data.csv'))
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    sentences = load_sentences(args.data)
+    print(f"{'workers':>7} {'req/s':>8} {'texts/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'batch':>6}")
+    for workers in [int(w) for w in args.workers.split(',')]:
+        process, client = start_server(args, workers, args.port)
+        try:
+            latencies, seconds = run_load(client, sentences, args.concurrency, args.duration, args.texts_per_request)
+            mean_batch = client.health()['mean_batch_size']
+        finally:
+            process.terminate()
+            process.wait()
+        latencies.sort()
+        print(f"{workers:>7} {len(latencies) / seconds:>8.1f} {len(latencies) * args.texts_per_request / seconds:>8.1f} "
+              f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+              f"{percentile(latencies, 99) * 1000:>8.1f} {mean_batch:>6.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+# The app modules import each other by bare name, as streamlit runs them from app/
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
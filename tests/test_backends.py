@@ -0,0 +1,17 @@
+from backends import get_backend, register_backend
+
+
+@register_backend('test-counting')
+class CountingBackend:
+    built = 0
+
+    def __init__(self, directory, batch_size=16):
+        CountingBackend.built += 1
+        self.batch_size = batch_size
+
+
+def test_backends_are_built_once_per_configuration():
+    first = get_backend('test-counting', 'model-dir')
+    assert get_backend('test-counting', 'model-dir') is first
+    assert get_backend('test-counting', 'model-dir', batch_size=32).batch_size == 32
+    assert CountingBackend.built == 2
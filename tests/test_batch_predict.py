@@ -0,0 +1,67 @@
+import csv
+import os
+
+import pytest
+
+from batch_predict import (CsvOutput, ParquetOutput, check_checkpoint, output_columns, read_chunks,
+                           run_settings)
+
+
+def rows(start, count):
+    return [[f'id{i}', 'A1', 1.0, 0, 0, 0, 0, 0] for i in range(start, start + count)]
+
+
+def test_read_chunks_skips_rows_already_scored(tmp_path):
+    path = os.path.join(tmp_path, 'input.csv')
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'sentence'])
+        writer.writerows([[str(i), f'Phrase {i}.'] for i in range(7)])
+    assert [[row_id for row_id, _ in chunk] for chunk in read_chunks(path, 3, skip=2)] == \
+        [['2', '3', '4'], ['5', '6']]
+
+
+def test_csv_output_resumes_at_the_checkpoint(tmp_path):
+    path = os.path.join(tmp_path, 'output.csv')
+    output = CsvOutput(path, None)
+    checkpoint = output.write(rows(0, 2))
+    output.write(rows(2, 2))  # Written after the last checkpoint, as if the run crashed
+    output.close()
+    output = CsvOutput(path, checkpoint)
+    output.write(rows(2, 3))
+    output.close()
+    with open(path, newline='', encoding='utf-8') as f:
+        written = list(csv.reader(f))
+    assert written[0] == output_columns
+    assert [row[0] for row in written[1:]] == [f'id{i}' for i in range(5)]
+
+
+def test_parquet_output_rewrites_parts_after_the_checkpoint(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = os.path.join(tmp_path, 'output.parquet')
+    output = ParquetOutput(path, None)
+    checkpoint = output.write(rows(0, 2))
+    output.write(rows(2, 2))
+    output = ParquetOutput(path, checkpoint)
+    output.write(rows(2, 3))
+    assert sorted(os.listdir(path)) == ['part-000000.parquet', 'part-000001.parquet']
+    assert pq.read_table(path).column('id').to_pylist() == [f'id{i}' for i in range(5)]
+
+
+def test_checkpoint_of_another_run_is_refused(tmp_path):
+    path = os.path.join(tmp_path, 'input.csv')
+    with open(path, 'w') as f:
+        f.write('id,sentence\n0,Bonjour.\n')
+    settings = run_settings(path, 'csv', False, 'model-a')
+    checkpoint = dict(settings, rows_done=1, output_bytes=10)
+    check_checkpoint(checkpoint, settings, 'output.csv.ckpt')
+    for changed in [run_settings(path, 'parquet', False, 'model-a'), run_settings(path, 'csv', False, 'model-b')]:
+        with pytest.raises(ValueError, match='pass --restart'):
+            check_checkpoint(checkpoint, changed, 'output.csv.ckpt')
+    with open(path, 'a') as f:
+        f.write('1,Au revoir.\n')
+    with pytest.raises(ValueError, match='input_bytes'):
+        check_checkpoint(checkpoint, run_settings(path, 'csv', False, 'model-a'), 'output.csv.ckpt')
+    # Checkpoints written before the settings were recorded are refused too
+    with pytest.raises(ValueError):
+        check_checkpoint({'rows_done': 1, 'output_bytes': 10}, settings, 'output.csv.ckpt')
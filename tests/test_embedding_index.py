@@ -0,0 +1,83 @@
+import json
+import os
+
+import numpy as np
+
+from embedding_index import AdaptiveAssessment, EmbeddingIndex, built_with_other_model
+from scoring import cefr_levels
+
+
+# Function to write an index by hand, with one-hot probabilities at the given expected levels
+def write_index(tmp_path, embeddings, levels, labels):
+    prefix = os.path.join(tmp_path, 'index')
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    probabilities = np.zeros((len(levels), len(cefr_levels)))
+    for row, level in enumerate(levels):
+        low = int(np.floor(level))
+        high = min(low + 1, len(cefr_levels) - 1)
+        probabilities[row, low] += 1 - (level - low)
+        probabilities[row, high] += level - low
+    np.save(prefix + '.embeddings.npy', embeddings.astype(np.float16))
+    np.save(prefix + '.probabilities.npy', probabilities.astype(np.float16))
+    np.save(prefix + '.labels.npy', np.asarray(labels, dtype=np.int8))
+    with open(prefix + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'model_fingerprint': None, 'texts': [f'phrase {i}' for i in range(len(levels))]}, f)
+    return EmbeddingIndex(prefix, chunk_rows=3)
+
+
+def test_search_returns_the_most_similar_sentences(tmp_path):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(10, 8))
+    index = write_index(tmp_path, embeddings, [0] * 10, [-1] * 10)
+    top, scores = index.search(embeddings[4], k=3)
+    assert top[0] == 4 and scores[0] > 0.99
+    assert list(scores) == sorted(scores, reverse=True)
+    neighbours, _ = index.neighbours(4, k=9)
+    assert 4 not in neighbours and len(neighbours) == 9
+
+
+def test_near_level_and_calibration(tmp_path):
+    # The model reads every sentence half a level too easy
+    levels = [max(level - 0.5, 0) for level in range(6) for _ in range(3)]
+    labels = [level for level in range(6) for _ in range(3)]
+    index = write_index(tmp_path, np.eye(18), levels, labels)
+    top, distances = index.near_level(3, k=3)
+    assert sorted(labels[i] for i in top) == [3, 3, 3]
+    assert np.allclose(distances, 0, atol=0.01)
+    top, _ = index.near_level(3, k=3, exclude=top)
+    assert all(labels[i] != 3 for i in top)
+
+
+def test_calibration_stays_monotone_when_the_model_swaps_levels(tmp_path):
+    # The model puts C2 sentences below C1 ones and A2 below A1
+    levels = {0: 1.0, 1: 0.5, 2: 2.0, 3: 3.0, 4: 4.5, 5: 4.0}
+    labels = [level for level in range(6) for _ in range(3)]
+    index = write_index(tmp_path, np.eye(18), [levels[label] for label in labels], labels)
+    xs, ys = index.calibration
+    assert np.all(np.diff(xs) > 0) and np.all(np.diff(ys) > 0)
+    grid = index.calibrate(np.linspace(0, 5, 51))
+    assert np.all(np.diff(grid) >= 0)
+
+
+def test_adaptive_assessment_moves_towards_the_answers(tmp_path):
+    levels = [level / 4 for level in range(21)]
+    index = write_index(tmp_path, np.eye(21) + 0.1, levels, [-1] * 21)
+    assessment = AdaptiveAssessment(length=6)
+    asked = []
+    while not assessment.done():
+        item = assessment.next_item(index)
+        assert assessment.next_item(index) == item
+        asked.append(item)
+        assessment.record('I understand it')
+    assert len(set(asked)) == len(asked)
+    assert assessment.level() == 'C2'
+    assert levels[asked[-1]] > levels[asked[0]]
+
+
+def test_model_check_uses_file_sizes_before_the_model_is_loaded(tmp_path):
+    with open(os.path.join(tmp_path, 'model.safetensors'), 'wb') as f:
+        f.write(b'0' * 10)
+    assert not built_with_other_model({'model_sizes': {'model.safetensors': 10}}, str(tmp_path))
+    assert built_with_other_model({'model_sizes': {'model.safetensors': 11}}, str(tmp_path))
+    assert not built_with_other_model({}, str(tmp_path))
@@ -0,0 +1,41 @@
+import os
+
+import fallback_classifier
+from fallback_classifier import CascadeScorer, FeatureClassifier, get_fallback_classifier, train_classifier
+from test_prediction_cache import StubScorer
+
+texts = ['Le chat dort.', 'Il fait beau.', "L'économie mondiale ralentit sous l'effet des taux.",
+         'Les négociations budgétaires se prolongent au Parlement.']
+labels = ['A1', 'A1', 'B2', 'B2']
+
+
+def test_missing_classifier_is_not_trained_on_first_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(fallback_classifier, 'train_classifier', lambda *args, **kwargs: 1 / 0)
+    path = os.path.join(tmp_path, 'fallback_classifier.npz')
+    assert get_fallback_classifier(path) is None
+    assert not os.path.exists(path)
+
+
+def test_cascade_fingerprint_follows_the_classifier_file(tmp_path):
+    path = os.path.join(tmp_path, 'fallback_classifier.npz')
+    scorer = StubScorer()
+    fingerprints = set()
+    for seed in (0, 1):
+        train_classifier(texts, labels, buckets=64, frequency_buckets=256, epochs=5, seed=seed).save(path)
+        cascade = CascadeScorer(FeatureClassifier.load(path), scorer, 0.8)
+        assert cascade.fingerprint.startswith('model-a:cascade=0.8:')
+        fingerprints.add(cascade.fingerprint)
+    assert len(fingerprints) == 2
+    # Neither a transformer nor a classifier of unknown provenance can be cached
+    assert CascadeScorer(FeatureClassifier.load(path), StubScorer(fingerprint=None), 0.8).fingerprint is None
+    assert CascadeScorer(train_classifier(texts, labels, epochs=1), scorer, 0.8).fingerprint is None
+
+
+def test_texts_without_words_are_always_escalated():
+    scorer = StubScorer()
+    cascade = CascadeScorer(train_classifier(texts * 5, labels * 5, buckets=64, frequency_buckets=256), scorer,
+                            threshold=0)
+    _, probabilities = cascade.score_texts(['...', '', 'Le chat dort.', ' !? '])
+    assert scorer.scored == ['...', '', ' !? ']
+    assert cascade.stats()['escalated'] == 3
+    assert probabilities[0] == StubScorer().score_texts(['...'])[1][0]
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+
+from feed_pipeline import FeedPipeline, iter_articles
+from prediction_cache import PredictionCache
+
+
+class StubSource:
+    def __init__(self, articles):
+        self.articles = articles
+
+    def fetch(self, category, offset=0, limit=25):
+        return self.articles[offset:offset + limit]
+
+
+class StubValidator:
+    def is_valid(self, url):
+        return url is not None
+
+
+# Scores every text as A1, counting how many texts reached the model
+class StubScorer:
+    def __init__(self):
+        self.scored = 0
+
+    def score_texts(self, texts):
+        self.scored += len(texts)
+        return ['A1'] * len(texts), [[1.0, 0, 0, 0, 0, 0] for _ in texts]
+
+
+def make_pipeline(tmp_path, articles, **options):
+    cache = PredictionCache(os.path.join(tmp_path, 'cache.sqlite3'), 'test')
+    return FeedPipeline(StubSource(articles), StubScorer(), cache, StubValidator(), **options)
+
+
+def article(i, **fields):
+    return dict({'title': f'Titre {i}', 'description': f'Description {i}', 'image': f'img/{i}', 'url': str(i)},
+                **fields)
+
+
+# Function to drain an iterator on a thread, failing instead of hanging the test run
+def collect(iterator, timeout=5):
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(iterator), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'pipeline did not finish'
+    return results
+
+
+def test_malformed_article_does_not_stall_its_batch(tmp_path):
+    articles = [article(0, title=None), article(1), 'not an article', article(2, title=['not', 'text']), article(3)]
+    pipeline = make_pipeline(tmp_path, articles, pages=1)
+    urls = [item['url'] for item in collect(iter_articles(pipeline, 'general'))]
+    assert sorted(urls) == ['0', '1', '3']
+    assert pipeline.errors
+
+
+def test_failing_callback_does_not_stall_the_pipeline(tmp_path):
+    def on_scored(item):
+        if item['url'] == '1':
+            raise RuntimeError('index unavailable')
+
+    pipeline = make_pipeline(tmp_path, [article(i) for i in range(4)], pages=1)
+    results = collect(iter_articles(pipeline, 'general', on_scored=on_scored))
+    assert len(results) == 4
+    assert any('on_scored' in error for error in pipeline.errors)
+
+
+def test_slow_reader_holds_the_pipeline_back(tmp_path):
+    pipeline = make_pipeline(tmp_path, [article(i) for i in range(200)], pages=1, page_size=200,
+                              queue_size=2, batch_size=1)
+    articles = iter_articles(pipeline, 'general')
+    next(articles)
+    time.sleep(0.5)
+    # Only the bounded queues and the batch in flight can be ahead of the reader
+    assert pipeline.scorer.scored < 20
+    assert len(collect(articles)) == 199
@@ -0,0 +1,33 @@
+import os
+
+import fine_tune
+from test_tokenization import StubTokenizer
+
+
+def write_csv(path, sentence):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"id,sentence,difficulty\n0,{sentence},A1\n")
+
+
+def test_prepare_corpus_notices_source_changes(tmp_path, monkeypatch):
+    calls = []
+    pretokenize = fine_tune.pretokenize
+    monkeypatch.setattr(fine_tune, 'pretokenize', lambda *args: calls.append(args) or pretokenize(*args))
+    path = os.path.join(tmp_path, 'train.csv')
+    prefix = os.path.join(tmp_path, 'corpus')
+    tokenizer = StubTokenizer()
+    write_csv(path, 'Le chat dort.')
+
+    fine_tune.prepare_corpus(path, prefix, tokenizer, 64)
+    fine_tune.prepare_corpus(path, prefix, tokenizer, 64)
+    assert len(calls) == 1
+    # Touched but unchanged
+    os.utime(path, ns=(0, 0))
+    fine_tune.prepare_corpus(path, prefix, tokenizer, 64)
+    assert len(calls) == 1
+    # Same size, different text
+    write_csv(path, 'Le chien dor.')
+    corpus = fine_tune.prepare_corpus(path, prefix, tokenizer, 64)
+    assert len(calls) == 2 and corpus.encoded() == [[2, 5, 4]]
+    fine_tune.prepare_corpus(path, prefix, tokenizer, 64, refresh=True)
+    assert len(calls) == 3
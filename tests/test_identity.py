@@ -0,0 +1,11 @@
+from identity import new_user_id, sign_user_id, verify_token
+
+
+def test_only_tokens_we_signed_are_accepted():
+    user_id = new_user_id()
+    token = sign_user_id(user_id, b'secret')
+    assert verify_token(token, b'secret') == user_id
+    assert verify_token(token, b'other secret') is None
+    assert verify_token(user_id, b'secret') is None
+    assert verify_token(f"someone-else.{token.rpartition('.')[2]}", b'secret') is None
+    assert verify_token(None, b'secret') is None
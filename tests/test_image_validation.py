@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from image_validation import ImageValidator
+
+
+# Stub image host: /img/* answers as a PNG, anything else is a 404, all after a fixed delay
+class StubImageHandler(BaseHTTPRequestHandler):
+    delay = 0
+    requests = Counter()
+
+    def do_HEAD(self):
+        StubImageHandler.requests[self.path] += 1
+        time.sleep(self.delay)
+        if self.path.startswith('/img/'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+        else:
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/html')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def base_url(monkeypatch):
+    monkeypatch.setattr(StubImageHandler, 'requests', Counter())
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def test_each_url_is_checked_once(base_url):
+    validator = ImageValidator()
+    urls = [f'{base_url}/img/a.png', f'{base_url}/img/a.png', f'{base_url}/page.html', None]
+    assert validator.validate_many(urls) == {urls[0]: True, urls[2]: False, None: False}
+    assert StubImageHandler.requests == Counter({'/img/a.png': 1, '/page.html': 1})
+
+
+def test_failed_checks_are_cached(base_url):
+    validator = ImageValidator()
+    for _ in range(3):
+        assert validator.is_valid(f'{base_url}/missing.png') is False
+    assert validator.is_valid('http://127.0.0.1:9/unreachable.png') is False
+    assert validator.is_valid('http://127.0.0.1:9/unreachable.png') is False
+    assert StubImageHandler.requests == Counter({'/missing.png': 1})
+
+
+def test_results_expire_after_the_ttl(base_url):
+    validator = ImageValidator(ttl=0.05)
+    url = f'{base_url}/img/a.png'
+    assert validator.is_valid(url) and validator.is_valid(url)
+    assert StubImageHandler.requests['/img/a.png'] == 1
+    time.sleep(0.1)
+    assert validator.is_valid(url)
+    assert StubImageHandler.requests['/img/a.png'] == 2
+
+
+def test_checks_run_concurrently(base_url, monkeypatch):
+    monkeypatch.setattr(StubImageHandler, 'delay', 0.2)
+    validator = ImageValidator(max_workers=8)
+    urls = [f'{base_url}/img/{i}.png' for i in range(8)]
+    start = time.perf_counter()
+    assert all(validator.validate_many(urls).values())
+    # One after the other would take 1.6s
+    assert time.perf_counter() - start < 0.8
@@ -0,0 +1,37 @@
+import queue
+import threading
+
+from inference_server import DynamicBatcher
+
+
+# A batcher without worker processes, for exercising how requests are split and batched
+def make_batcher(max_batch_size=4):
+    batcher = DynamicBatcher.__new__(DynamicBatcher)
+    batcher.max_batch_size = max_batch_size
+    batcher.max_wait = 0.01
+    batcher.pending = queue.Queue()
+    batcher.held = None
+    return batcher
+
+
+def batch_sizes(batcher, count):
+    return [sum(len(texts) for texts, _ in batcher._next_batch()) for _ in range(count)]
+
+
+def test_batches_never_exceed_max_batch_size():
+    batcher = make_batcher()
+    for size in [3, 3, 1, 2]:
+        batcher.submit([str(i) for i in range(size)])
+    assert batch_sizes(batcher, 3) == [3, 4, 2]
+
+
+def test_large_requests_are_split_and_reassembled():
+    batcher = make_batcher()
+    future = batcher.submit([str(i) for i in range(10)])
+    assert batch_sizes(batcher, 0) == []
+    parts = [batcher.pending.get_nowait() for _ in range(3)]
+    assert [len(texts) for texts, _ in parts] == [4, 4, 2]
+    # Parts may finish in any order; the combined result keeps the input order
+    for texts, part_future in reversed(parts):
+        threading.Thread(target=part_future.set_result, args=([[int(text)] for text in texts],)).start()
+    assert future.result(timeout=5) == [[i] for i in range(10)]
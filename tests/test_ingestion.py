@@ -0,0 +1,63 @@
+import os
+import time
+
+from ingestion import FeedIndex, IngestionWorker, JsonFixtureSource
+from prediction_cache import PredictionCache
+from test_feed_pipeline import StubValidator
+
+fixture_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'articles.json')
+
+
+# Scores short texts as A1 and longer ones as B2
+class LengthScorer:
+    def score_texts(self, texts):
+        levels = ['A1' if len(text.split()) < 10 else 'B2' for text in texts]
+        return levels, [[1.0, 0, 0, 0, 0, 0] if level == 'A1' else [0, 0, 0, 1.0, 0, 0] for level in levels]
+
+
+def test_run_once_indexes_fixture_articles_by_level(tmp_path):
+    index = FeedIndex()
+    cache = PredictionCache(os.path.join(tmp_path, 'cache.sqlite3'), 'test')
+    worker = IngestionWorker(index, source=JsonFixtureSource(fixture_path), categories=['general', 'sports'],
+                             pages=1, scorer_loader=LengthScorer, cache=cache, validator=StubValidator())
+    worker.run_once()
+
+    assert [article['url'] for article in index.get('general', 'A1')] == ['https://example.org/general/1']
+    assert [article['url'] for article in index.get('general', 'B2')] == ['https://example.org/general/2']
+    assert [article['url'] for article in index.get('sports', 'A1')] == ['https://example.org/sports/1']
+    assert index.get('sports', 'B2') == ()
+    assert index.is_ready('general') and index.last_error('general') is None
+    assert index.category_size('general') == 2
+
+
+# Fails every fetch of the given categories until told to recover
+class FlakySource(JsonFixtureSource):
+    def __init__(self, path, failing):
+        super().__init__(path)
+        self.failing = set(failing)
+
+    def fetch(self, category, offset=0, limit=25):
+        if category in self.failing:
+            raise RuntimeError('mediastack returned status 503')
+        return super().fetch(category, offset, limit)
+
+
+def test_failed_categories_are_retried_before_the_next_refresh(tmp_path):
+    index = FeedIndex()
+    source = FlakySource(fixture_path, failing=['sports'])
+    cache = PredictionCache(os.path.join(tmp_path, 'cache.sqlite3'), 'test')
+    worker = IngestionWorker(index, source=source, categories=['general', 'sports'], pages=1, interval=3600,
+                             scorer_loader=LengthScorer, cache=cache, validator=StubValidator(), retry_delay=0.05)
+    worker.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not index.is_ready('sports') and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert index.last_error('sports') and index.get('sports', 'A1') == ()
+        source.failing.clear()
+        while index.last_error('sports') and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert index.last_error('sports') is None
+        assert [article['url'] for article in index.get('sports', 'A1')] == ['https://example.org/sports/1']
+    finally:
+        worker.stop()
@@ -0,0 +1,57 @@
+import os
+import pstats
+import threading
+
+import instrumentation
+
+
+def busy():
+    return sum(i * i for i in range(10000))
+
+
+def test_profiling_alone_times_stages(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, '_enabled', False)
+    instrumentation.start_profiling()
+    with instrumentation.timer('forward'):
+        busy()
+    path = instrumentation.stop_profiling(os.path.join(tmp_path, 'profile.pstats'))
+    assert path is not None and os.path.exists(path)
+
+
+def test_profiling_can_be_restarted(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, '_enabled', True)
+    for cycle in range(2):
+        instrumentation.start_profiling()
+        with instrumentation.timer('forward'):
+            busy()
+        assert instrumentation.stop_profiling(os.path.join(tmp_path, f'profile-{cycle}.pstats')) is not None
+
+
+def test_stop_profiling_waits_for_running_stages(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, '_enabled', False)
+    instrumentation.start_profiling()
+    entered, release = threading.Event(), threading.Event()
+
+    def stage():
+        with instrumentation.timer('forward'):
+            entered.set()
+            release.wait()
+            busy()
+
+    worker = threading.Thread(target=stage)
+    worker.start()
+    entered.wait()
+    paths = []
+    stopper = threading.Thread(target=lambda: paths.append(
+        instrumentation.stop_profiling(os.path.join(tmp_path, 'profile.pstats'))))
+    stopper.start()
+    stopper.join(0.2)
+    assert stopper.is_alive() and not paths
+    # Stages started once stopping has begun are not profiled and do not hold it up
+    with instrumentation.timer('forward'):
+        busy()
+    release.set()
+    stopper.join(5)
+    worker.join(5)
+    assert paths and os.path.exists(paths[0])
+    assert 'busy' in str(pstats.Stats(paths[0]).stats)
@@ -0,0 +1,91 @@
+import math
+import os
+
+import pytest
+
+from long_document import iter_sentences, score_document
+from prediction_cache import PredictionCache
+
+# Sentences of the test document with the distribution the stub model gives each; quarters survive the cache exactly
+distributions = {
+    'Le chat dort.': [1, 0, 0, 0, 0, 0],
+    'Le chien court.': [0.25, 0.75, 0, 0, 0, 0],
+    'La philosophie kantienne est ardue.': [0, 0, 0, 0, 0.25, 0.75],
+}
+document = 'Le chat dort. Le chien court. La philosophie kantienne est ardue. Le chat dort.'
+
+
+class StubScorer:
+    fingerprint = None
+
+    def __init__(self):
+        self.scored = []
+
+    def score_texts(self, texts):
+        self.scored.extend(texts)
+        return ['A1'] * len(texts), [distributions[text] for text in texts]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = PredictionCache(os.path.join(tmp_path, 'predictions.sqlite3'), 'stub-model')
+    yield cache
+    cache.close()
+
+
+def test_french_closing_guillemets_end_the_sentence():
+    text = 'Il a dit « Bonjour ! » Puis il est parti.'
+    assert list(iter_sentences(text)) == ['Il a dit « Bonjour ! »', 'Puis il est parti.']
+
+
+def test_spaced_guillemets_and_abbreviations():
+    text = "« C'est fini. » M. Dupont est rentré.\u00a0» Le lendemain, il pleuvait.\n\nFin"
+    assert list(iter_sentences(text)) == ["« C'est fini. »", 'M. Dupont est rentré. »',
+                                          'Le lendemain, il pleuvait.', 'Fin']
+
+
+def test_mean_aggregation(cache):
+    scorer = StubScorer()
+    result = score_document(document, scorer, cache=cache)
+    assert result['sentences'] == 4
+    assert result['distribution'] == {'A1': 0.5625, 'A2': 0.1875, 'B1': 0, 'B2': 0, 'C1': 0.0625, 'C2': 0.1875}
+    assert result['level'] == 'A1'
+    # The repeated sentence is scored once and a second pass is served from the cache
+    assert sorted(scorer.scored) == sorted(distributions)
+    score_document(document, scorer, cache=cache)
+    assert len(scorer.scored) == len(distributions)
+
+
+def test_max_aggregation_weights_hard_sentences(cache):
+    result = score_document(document, StubScorer(), aggregate='max', cache=cache)
+    weights = {'Le chat dort.': 2 * math.exp(0), 'Le chien court.': math.exp(0.75),
+               'La philosophie kantienne est ardue.': math.exp(4.75)}
+    total = sum(weights.values())
+    expected = [sum(weights[sentence] * distributions[sentence][i] for sentence in weights) / total for i in range(6)]
+    assert list(result['distribution'].values()) == pytest.approx(expected)
+    assert result['level'] == 'C2'
+
+
+@pytest.mark.parametrize('percentile, level', [(50, 'A1'), (75, 'A2'), (90, 'C2')])
+def test_percentile_aggregation(cache, percentile, level):
+    result = score_document(document, StubScorer(), aggregate='percentile', percentile=percentile, cache=cache)
+    assert result['distribution'] == {'A1': 0.5, 'A2': 0.25, 'B1': 0, 'B2': 0, 'C1': 0, 'C2': 0.25}
+    assert result['level'] == level
+
+
+def test_hardest_sentences_are_ranked_and_listed_once(cache):
+    result = score_document(document, StubScorer(), top_k=2, cache=cache)
+    assert result['hardest_sentences'] == [
+        {'sentence': 'La philosophie kantienne est ardue.', 'expected_level': 4.75, 'level': 'C2'},
+        {'sentence': 'Le chien court.', 'expected_level': 0.75, 'level': 'A2'}]
+    result = score_document(document, StubScorer(), top_k=10, cache=cache)
+    assert [entry['sentence'] for entry in result['hardest_sentences']] == \
+        ['La philosophie kantienne est ardue.', 'Le chien court.', 'Le chat dort.']
+    assert score_document(document, StubScorer(), top_k=0, cache=cache)['hardest_sentences'] == []
+
+
+def test_text_without_sentences(cache):
+    scorer = StubScorer()
+    assert score_document(' \n\n ', scorer, cache=cache) == \
+        {'level': None, 'distribution': {}, 'sentences': 0, 'hardest_sentences': []}
+    assert scorer.scored == []
@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import inference_client
+import prediction_cache
+from inference_client import InferenceClient
+from prediction_cache import PredictionCache, cached_score_texts, get_prediction_cache
+
+
+class StubHealthHandler(BaseHTTPRequestHandler):
+    fingerprint = 'served-model:torch'
+
+    def do_GET(self):
+        payload = json.dumps({'ready': bool(self.fingerprint), 'model_fingerprint': self.fingerprint}).encode('utf-8')
+        self.send_response(200 if self.fingerprint else 503)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Gives every text a distribution of its own, counting the texts it was asked to score
+class StubScorer:
+    def __init__(self, fingerprint='model-a'):
+        self.fingerprint = fingerprint
+        self.scored = []
+
+    def score_texts(self, texts):
+        self.scored.extend(texts)
+        # Quarters survive the float32 round trip through SQLite exactly
+        probabilities = [[(len(text) % 3 + 1) / 4, 0, 0, 0, 0, 1 - (len(text) % 3 + 1) / 4] for text in texts]
+        return ['A1'] * len(texts), probabilities
+
+
+def test_cache_is_keyed_on_the_served_model(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHealthHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('PREDICTION_CACHE_PATH', os.path.join(tmp_path, 'cache', 'predictions.sqlite3'))
+    monkeypatch.setattr(prediction_cache, '_caches', {})
+    monkeypatch.setattr(inference_client, '_fingerprints', {})
+    try:
+        cache = get_prediction_cache(InferenceClient(f'http://127.0.0.1:{server.server_port}'))
+        assert cache.fingerprint == 'served-model:torch'
+        cache.close()
+    finally:
+        server.shutdown()
+
+
+def test_service_still_loading_is_scored_uncached_and_asked_again(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHealthHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('PREDICTION_CACHE_PATH', os.path.join(tmp_path, 'predictions.sqlite3'))
+    monkeypatch.setattr(prediction_cache, '_caches', {})
+    monkeypatch.setattr(inference_client, '_fingerprints', {})
+    monkeypatch.setattr(inference_client, 'fingerprint_retry', 0)
+    monkeypatch.setattr(StubHealthHandler, 'fingerprint', None)
+    client = InferenceClient(f'http://127.0.0.1:{server.server_port}')
+    try:
+        assert get_prediction_cache(client) is None
+        monkeypatch.setattr(StubHealthHandler, 'fingerprint', 'served-model:torch')
+        assert get_prediction_cache(client).fingerprint == 'served-model:torch'
+    finally:
+        server.shutdown()
+    # Unreachable
+    assert get_prediction_cache(InferenceClient('http://127.0.0.1:9')) is None
+
+
+def test_scorer_without_fingerprint_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(prediction_cache, '_caches', {})
+    scorer = StubScorer(fingerprint=None)
+    assert get_prediction_cache(scorer) is None
+    cached_score_texts(['Bonjour.'], scorer)
+    cached_score_texts(['Bonjour.'], scorer)
+    assert scorer.scored == ['Bonjour.', 'Bonjour.']
+
+
+def test_memory_and_disk_hits(tmp_path):
+    path = os.path.join(tmp_path, 'predictions.sqlite3')
+    scorer = StubScorer()
+    cache = PredictionCache(path, 'model-a', memory_size=1)
+    first = cached_score_texts(['Un.', 'Deux.', 'Un.'], scorer, cache)
+    assert scorer.scored == ['Un.', 'Deux.']
+    assert cached_score_texts(['Deux.'], scorer, cache)[1] == [first[1][1]]
+    assert cached_score_texts(['  Un. '], scorer, cache)[1] == [first[1][0]]
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['disk_hits'], stats['misses']) == (1, 1, 3)
+    # A new process finds the entries on disk
+    reopened = PredictionCache(path, 'model-a')
+    assert cached_score_texts(['Un.', 'Deux.'], scorer, reopened)[1] == [first[1][0], first[1][1]]
+    assert len(scorer.scored) == 2 and reopened.stats()['disk_hits'] == 2
+
+
+def test_eviction_keeps_the_most_recently_used(tmp_path):
+    cache = PredictionCache(os.path.join(tmp_path, 'predictions.sqlite3'), 'model-a', memory_size=0,
+                            max_entries=10)
+    for i in range(10):
+        cache.put_many([f'phrase {i}'], [[1.0, 0, 0, 0, 0, 0]])
+    cache.get_many(['phrase 0'])
+    cache.put_many(['phrase 10'], [[1.0, 0, 0, 0, 0, 0]])
+    stats = cache.stats()
+    assert stats['entries'] == 9 and stats['evictions'] == 2
+    assert set(cache.get_many([f'phrase {i}' for i in (0, 1, 2, 10)])) == {0, 3}
+
+
+def test_other_models_entries_are_kept_but_never_hit(tmp_path):
+    path = os.path.join(tmp_path, 'predictions.sqlite3')
+    old = PredictionCache(path, 'model-a')
+    old.put_many(['Bonjour.'], [[1.0, 0, 0, 0, 0, 0]])
+    new = PredictionCache(path, 'model-b')
+    assert new.get_many(['Bonjour.']) == {}
+    assert old.get_many(['Bonjour.']) == {0: [1.0, 0, 0, 0, 0, 0]}
+    assert PredictionCache(path, 'model-a').get_many(['Bonjour.']) == {0: [1.0, 0, 0, 0, 0, 0]}
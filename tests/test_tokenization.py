@@ -0,0 +1,29 @@
+import csv
+import os
+
+from tokenization import PretokenizedCorpus, pretokenize
+
+
+class StubTokenizer:
+    pad_token_id = 0
+
+    def __len__(self):
+        return 1000
+
+    def __call__(self, texts, truncation=True, max_length=512, padding=False):
+        return {'input_ids': [[len(word) for word in text.split()][:max_length] for text in texts]}
+
+
+def test_pretokenize_maps_row_ids(tmp_path):
+    path = os.path.join(tmp_path, 'corpus.csv')
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'sentence', 'difficulty'])
+        writer.writerows([['a-1', 'Le chat dort.', 'A1'], ['été-2', 'Il pleut beaucoup ici.', 'A2']])
+    prefix = os.path.join(tmp_path, 'corpus')
+    pretokenize(path, prefix, StubTokenizer(), chunk_size=1)
+    corpus = PretokenizedCorpus(prefix)
+    assert len(corpus) == len(corpus.row_ids) == 2
+    assert [corpus.row_ids[i] for i in range(2)] == ['a-1', 'été-2']
+    assert corpus.encoded() == [[2, 4, 5], [2, 5, 8, 4]]
+    assert 'row_ids' not in corpus.meta
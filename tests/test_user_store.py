@@ -0,0 +1,40 @@
+import os
+import threading
+
+import pytest
+
+from user_store import SQLiteUserStore, UserStore, apply_feedback, default_level
+
+
+def test_user_store_is_abstract():
+    with pytest.raises(TypeError):
+        UserStore()
+
+
+def test_viewing_a_learner_does_not_store_them(tmp_path):
+    store = SQLiteUserStore(os.path.join(tmp_path, 'users.sqlite3'))
+    assert store.get_user('visitor') == {'level': default_level, 'feedback_points': 0}
+    assert store._reader().execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0
+
+
+def test_concurrent_feedback_is_never_lost(tmp_path):
+    path = os.path.join(tmp_path, 'users.sqlite3')
+    # Two stores on one file stand in for two processes
+    stores = [SQLiteUserStore(path), SQLiteUserStore(path)]
+    clicks = ['Just Right'] * 200
+    threads = [threading.Thread(target=lambda i=i: stores[i % 2].record_feedback('learner', clicks[i]))
+               for i in range(len(clicks))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    level, points = default_level, 0
+    for feedback in clicks:
+        level, points = apply_feedback(level, points, feedback)
+    assert stores[0].get_user('learner') == {'level': level, 'feedback_points': points}
+    history = stores[1].feedback_history('learner', limit=1000)
+    assert len(history) == len(clicks)
+    # Every event starts from the state the previous one left
+    for before, after in zip(reversed(history[1:]), reversed(history[:-1])):
+        assert after['level_before'] == before['level_after']